@@ -16,7 +16,11 @@ OFX_EXTENSION = 'ofx'
 # -----------------------------------------------------------------------------
 # -- ofxget definitions
 # -----------------------------------------------------------------------------
-OFXGET_CFG = ofxtools_config.USERCONFIGDIR / 'ofxget.cfg'
+OFXGET_CFG_NAME = 'ofxget.cfg'
+OFXGET_CFG = ofxtools_config.USERCONFIGDIR / OFXGET_CFG_NAME
+# ofxtools reads its config from this folder of the config home ($XDG_CONFIG_HOME on linux,
+# %APPDATA% on windows).
+OFXGET_CFG_FOLDER = ofxtools_config.USERCONFIGDIR.name
 OFXGET_CFG_USER_LABEL = 'user'
 OFXGET_DEFAULT_SERVER = 'DEFAULT'
 
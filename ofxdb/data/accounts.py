@@ -29,10 +29,17 @@ class UserConfig(ConfigParser):
 # -----------------------------------------------------------------------------
 
 
-def get_user_cfg() -> UserConfig:
-    """Retrieve user config from ofxget.cfg file."""
+def get_user_cfg(cfg_file: str = cfg.OFXGET_CFG) -> UserConfig:
+    """Retrieve user config from ofxget.cfg file.
+
+    Args:
+        cfg_file: ofxget config file path (see file_util.tenant_cfg_file for tenant configs).
+
+    Returns:
+        User config.
+    """
     user_cfg = UserConfig()
-    user_cfg.read(cfg.OFXGET_CFG)
+    user_cfg.read(cfg_file)
     return user_cfg
 
 
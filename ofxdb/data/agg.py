@@ -9,18 +9,19 @@ balances.csv
 positions.csv
 securities.csv
 transactions.csv
+
+and updates the balance and cash-flow rollups (see ofxdb.data.rollup).
 """
-import os
 import datetime
 from decimal import Decimal
-from typing import Union, List
+from typing import Dict, Union, List
 
 import pandas as pd
 from ofxtools.Parser import OFXTree
 from ofxtools.models import Aggregate, SubAggregate
 
-from ofxdb.data import accounts
-from ofxdb.utils import file_util
+from ofxdb.data import accounts, rollup, schema
+from ofxdb.utils import file_util, journal
 from ofxdb import cfg
 
 # -----------------------------------------------------------------------------
@@ -196,64 +197,69 @@ def generate_records(
     return [get_model_record(ofx_model=ofx_model, acct_info=acct_info)]
 
 
-def write_records(records: List[dict], file_name: str) -> None:
-    """Write records to disk, appending to existing table.
+def write_records(
+        records: List[dict], table: str, txn: journal.Transaction) -> pd.DataFrame:
+    """Write records to a new partition of the table.
+
+    Existing partitions are never read or rewritten, so writes are O(new data). Columns are ordered
+    by the table schema (see schema.order_columns) and recorded with the partition, so columns that
+    are new to the table only widen the new partition.
 
     Args:
         records: List of record dicts.
-        file_name: Destination file name.
+        table: Destination table name.
+        txn: Aggregation run transaction.
 
     Returns:
-        None
+        pandas DataFrame containing the written records.
     """
     # TODO (ricrosales): This should replace data for given account instead of just appending
     new_df = pd.DataFrame(records).set_index(_INDEX_COL)
-    if os.path.exists(file_name):
-        file_df = pd.read_csv(file_name, index_col=_INDEX_COL)
-        file_df = file_df.append(new_df)
-    else:
-        file_df = new_df
-    file_df.to_csv(file_name)
+    new_df = new_df[schema.order_columns(table, list(new_df.columns))]
+    file_name = txn.stage_partition(
+        table, columns=[_INDEX_COL] + list(new_df.columns), rows=len(new_df))
+    new_df.to_csv(file_name)
+    return new_df
 
 
 def process_ofx_model(
         ofx_model: Union[_OFXToolsBaseModel, List[_OFXToolsBaseModel]],
         acct_info: dict,
         table: str,
-        db_dir: str) -> None:
+        table_records: Dict[str, List[dict]]) -> None:
     """Process OFX model.
 
     1) Generate records from ofxtools model.
-    2) Get destination file.
-    3) Write records to disk.
+    2) Collect records for the destination table.
 
     Args:
         ofx_model: ofxtools model or list of ofxtools models.
         acct_info: Account information dict (date, datetime, server, user, acctid).
         table: Destination table name for given model.
-        db_dir: Database base directory path.
+        table_records: Table name -> records collected during the run.
 
     Returns:
         None
     """
     records = generate_records(ofx_model=ofx_model, acct_info=acct_info)
     if records:
-        file_name = file_util.table_file(table, db_dir=db_dir)
-        write_records(records, file_name)
+        table_records.setdefault(table, []).extend(records)
 
 
-def process_statement_model(stmt: _OFXToolsBaseModel, acct_info: dict, db_dir: str) -> None:
+def process_statement_model(
+        stmt: _OFXToolsBaseModel,
+        acct_info: dict,
+        table_records: Dict[str, List[dict]]) -> None:
     """Process ofxtools statement model.
 
     1) Generate records from ofxtools model.
-    2) Get destination file.
-    3) Write records to disk.
-    4) Process associated transactions, positions, and balances
+    2) Collect records for the acct_info table.
+    3) Process associated transactions, positions, and balances
 
     Args:
         stmt:
         acct_info:
-        db_dir:
+        table_records: Table name -> records collected during the run.
 
     Returns:
         None
@@ -274,8 +280,7 @@ def process_statement_model(stmt: _OFXToolsBaseModel, acct_info: dict, db_dir: s
 
     if _OFX_ACCTID not in cur_acct_info:
         raise ValueError(f'Statement account info did not contain acctid.\n{stmt}')
-    acct_info_file = file_util.table_file('acct_info', db_dir=db_dir)
-    write_records(acct_info_records, acct_info_file)
+    table_records.setdefault('acct_info', []).extend(acct_info_records)
 
     statement_table_map = [
         (stmt.transactions, 'transactions'),
@@ -283,7 +288,8 @@ def process_statement_model(stmt: _OFXToolsBaseModel, acct_info: dict, db_dir: s
         (stmt.balances.ballist, 'balances')
     ]
     for ofx_model, table in statement_table_map:
-        process_ofx_model(ofx_model=ofx_model, acct_info=cur_acct_info, table=table, db_dir=db_dir)
+        process_ofx_model(
+            ofx_model=ofx_model, acct_info=cur_acct_info, table=table, table_records=table_records)
 
 
 # -----------------------------------------------------------------------------
@@ -292,33 +298,55 @@ def process_statement_model(stmt: _OFXToolsBaseModel, acct_info: dict, db_dir: s
 _STMT_FOLDER = 'stmt'
 
 
-def agg(db_dir: str = cfg.DB_DIR) -> None:
+def agg(db_dir: str = cfg.DB_DIR, cfg_file: str = cfg.OFXGET_CFG) -> None:
     """Aggregate current ofx files to the database.
 
+    Records are collected for the whole run and written as one new partition per table, together
+    with the rollup deltas of the run (see rollup.write_rollups). All partitions of the run are
+    committed together (see ofxdb.utils.journal). If any ofx file fails
+    to parse or process, no table is updated and the run can be retried.
+
     Args:
         db_dir:  Database base directory path.
+        cfg_file: ofxget config file path.
 
     Returns:
         None
     """
     parser = OFXTree()
-    user_cfg = accounts.get_user_cfg()
-    for server, server_config in user_cfg.items():
-        if server != cfg.OFXGET_DEFAULT_SERVER:
-            user = server_config[cfg.OFXGET_CFG_USER_LABEL]
-            file_name = f'{db_dir}/{_STMT_FOLDER}/' \
-                        f'{cfg.CURRENT_PREFIX}_{server}_{user}.{cfg.OFX_EXTENSION}'
-            with open(file_name, 'rb') as ofx_file:
-                parser.parse(ofx_file)
-            ofx = parser.convert()
-            agg_datetime = datetime.datetime.today().replace(tzinfo=cfg.OFX_TIMEZONE)
-            agg_date = agg_datetime.date()
-            acct_info = {'datetime': agg_datetime, 'date': agg_date, 'server': server, 'user': user}
-            for stmt in ofx.statements:
-                process_statement_model(stmt=stmt, acct_info=acct_info, db_dir=db_dir)
-            process_ofx_model(
-                ofx_model=ofx.securities, acct_info=acct_info, table='securities', db_dir=db_dir
-            )
+    user_cfg = accounts.get_user_cfg(cfg_file)
+    table_records: Dict[str, List[dict]] = {}
+    with journal.Transaction(db_dir) as txn:
+        for server, server_config in user_cfg.items():
+            if server != cfg.OFXGET_DEFAULT_SERVER:
+                user = server_config[cfg.OFXGET_CFG_USER_LABEL]
+                file_name = f'{db_dir}/{_STMT_FOLDER}/' \
+                            f'{cfg.CURRENT_PREFIX}_{server}_{user}.{cfg.OFX_EXTENSION}'
+                with open(file_name, 'rb') as ofx_file:
+                    parser.parse(ofx_file)
+                ofx = parser.convert()
+                agg_datetime = datetime.datetime.today().replace(tzinfo=cfg.OFX_TIMEZONE)
+                agg_date = agg_datetime.date()
+                acct_info = {
+                    'datetime': agg_datetime, 'date': agg_date, 'server': server, 'user': user
+                }
+                for stmt in ofx.statements:
+                    process_statement_model(
+                        stmt=stmt, acct_info=acct_info, table_records=table_records)
+                process_ofx_model(
+                    ofx_model=ofx.securities, acct_info=acct_info, table='securities',
+                    table_records=table_records
+                )
+        new_tables = {
+            table: write_records(records, table, txn) for table, records in table_records.items()
+        }
+        rollup.write_rollups(new_tables, txn)
+
+    # Refresh memory-mapped copies once per run rather than after every table write.
+    manifest = file_util.read_manifest(db_dir)
+    for table in file_util.MMAP_COLUMNS:
+        if file_util.table_partitions(table, db_dir=db_dir, manifest=manifest):
+            file_util.write_mmap(table, db_dir=db_dir, manifest=manifest)
 
 
 if __name__ == '__main__':
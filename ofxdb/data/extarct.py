@@ -5,7 +5,10 @@ Runs ofxget command line tool to retrieve OFX files from financial institutions.
 database directory defined in cfg.py.
 """
 import os
+import sys
 import datetime
+import subprocess
+from typing import Optional
 
 from ofxdb.data import accounts
 from ofxdb import cfg
@@ -16,11 +19,43 @@ from ofxdb import cfg
 _OFXGET_CMD = 'ofxget'
 _OFXGET_USER_ARG = '-u'
 _MULTI_OFX_TYPES = ['stmt']
-_MULTI_OFX_ARGS = ' --all'
+_MULTI_OFX_ARGS = ['--all']
+# Environment variables ofxtools reads its config home from (see ofxtools.config). On macOS it
+# always reads ~/Library/Preferences, so other config homes are not supported there.
+_CONFIG_HOME_VAR = 'XDG_CONFIG_HOME'
+_WINDOWS_CONFIG_HOME_VAR = 'APPDATA'
+
+
+def config_env(config_home: str) -> dict:
+    """Get the environment that makes ofxget read its config from a config home.
+
+    Args:
+        config_home: Config home holding the ofxget config to use.
+
+    Returns:
+        Environment dict for the ofxget process.
+
+    Raises:
+        ValueError: Encountered platform where ofxtools does not support other config homes.
+    """
+    platform = sys.platform.lower()
+    if platform.startswith('darwin'):
+        raise ValueError(
+            f'Config home ({config_home}) not supported on platform ({sys.platform}): ofxget '
+            f'always reads {cfg.OFXGET_CFG}. Try running on linux or windows.'
+        )
+    if platform.startswith('win'):
+        return {**os.environ, _WINDOWS_CONFIG_HOME_VAR: config_home}
+    return {**os.environ, _CONFIG_HOME_VAR: config_home}
 
 
 # TODO(ricrosales): Migrate to using ofxtools class to fetch instead of ofxget command line.
-def fetch_file(ofx_type: str, server: str, user: str, verbose: bool = False) -> str:
+def fetch_file(
+        ofx_type: str,
+        server: str,
+        user: str,
+        verbose: bool = False,
+        config_home: Optional[str] = None) -> str:
     """Fetch OFX file from financial institutions server.
 
     Args:
@@ -28,18 +63,24 @@ def fetch_file(ofx_type: str, server: str, user: str, verbose: bool = False) ->
         server: ofxtools server nickname for financial institution.
         user: User name to fetch file for.
         verbose: Enable verbosity.
+        config_home: Config home holding the ofxget config to use (e.g. of a tenant, see
+                     file_util.tenant_config_home). ofxget reads the global config if None.
 
     Returns:
         A string containing ofx file contents. File has nested xml structure depending on file type.
+
+    Raises:
+        ValueError: Encountered config home on a platform that does not support it (see
+                    config_env).
     """
     ofx_type = ofx_type.lower()
-    cmd = f'{_OFXGET_CMD} {ofx_type} {server} {_OFXGET_USER_ARG} {user}'
+    cmd = [_OFXGET_CMD, ofx_type, server, _OFXGET_USER_ARG, user]
     if ofx_type in _MULTI_OFX_TYPES:
         cmd += _MULTI_OFX_ARGS
+    env = None if config_home is None else config_env(config_home)
     if verbose:
-        print(cmd)
-    stream = os.popen(cmd)
-    return stream.read()
+        print(' '.join(cmd))
+    return subprocess.run(cmd, stdout=subprocess.PIPE, env=env, text=True).stdout
 
 
 # -----------------------------------------------------------------------------
@@ -92,22 +133,34 @@ def write_file(
 _OFX_SUPPORTED_TYPES = ['acctinfo', 'stmt']
 
 
-def extract(verbose: bool = False) -> None:
+def extract(
+        verbose: bool = False,
+        db_dir: str = cfg.DB_DIR,
+        config_home: Optional[str] = None) -> None:
     """Extract all OFX data for all users and servers in the ofxtools user config.
 
     Args:
         verbose: Enable verbosity.
+        db_dir: Database directory base path.
+        config_home: Config home holding the ofxget config to use (see fetch_file). Uses the
+                     global ofxget config if None.
 
     Returns:
         None
     """
-    user_cfg = accounts.get_user_cfg()
+    cfg_file = cfg.OFXGET_CFG
+    if config_home is not None:
+        cfg_file = f'{config_home}/{cfg.OFXGET_CFG_FOLDER}/{cfg.OFXGET_CFG_NAME}'
+    user_cfg = accounts.get_user_cfg(cfg_file)
     for server, server_config in user_cfg.items():
         if server != cfg.OFXGET_DEFAULT_SERVER:
             user = server_config[cfg.OFXGET_CFG_USER_LABEL]
             for ofx_type in _OFX_SUPPORTED_TYPES:
-                ofx_file = fetch_file(ofx_type=ofx_type, server=server, user=user, verbose=verbose)
-                write_file(ofx_file=ofx_file, ofx_type=ofx_type, server=server, user=user)
+                ofx_file = fetch_file(
+                    ofx_type=ofx_type, server=server, user=user, verbose=verbose,
+                    config_home=config_home)
+                write_file(
+                    ofx_file=ofx_file, ofx_type=ofx_type, server=server, user=user, db_dir=db_dir)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,339 @@
+#!python
+"""Rollup table module.
+
+Maintains pre-aggregated cash-flow and balance tables by account and period, so that period
+reports scale with the number of periods rather than the number of transactions.
+
+Rollups are append-only like every other table: each aggregation run adds one partition per rollup
+holding the deltas of the records it added, in the same transaction (see ofxdb.utils.journal).
+Rolling back or compacting a run therefore keeps the rollups consistent with their source tables.
+Readers combine the deltas (see combine_flows and combine_balances):
+
+flow_rollup: sums of the transactions of each run by period and account. Transactions are
+             identified by (acctid, fitid) and are only counted the first time a run sees them.
+balance_rollup: latest balance of each run by period, account and balance.
+
+Rollups are backfilled from the full source tables the first time a run writes them. Databases
+aggregated before rollups existed can be backfilled without a run (see rebuild_rollups):
+
+python ofxdb/data/rollup.py --rebuild
+"""
+import argparse
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from ofxdb.utils import date_util, file_util, journal
+from ofxdb import cfg
+
+# -----------------------------------------------------------------------------
+# -- Rollup definitions
+# -----------------------------------------------------------------------------
+PERIODS = {
+    'D': '%Y-%m-%d',
+    'M': '%Y-%m',
+}
+PERIOD_COL = 'period'
+FREQ_COL = 'freq'
+ACCTID_COL = 'acctid'
+
+FLOW_KEYS = [FREQ_COL, ACCTID_COL]
+FLOW_VALUES = ['inflow', 'outflow', 'net_flow', 'fees', 'dividends', 'count']
+_TRANSACTION_KEYS = [ACCTID_COL, 'fitid']
+_TRANSACTION_DATES = ['dttrade', 'dtposted', 'date']
+_FEE_COLUMNS = ['fees', 'commission', 'load']
+_DIVIDEND_TYPE = 'DIV'
+TRANSACTION_COLUMNS = _TRANSACTION_KEYS + _TRANSACTION_DATES + _FEE_COLUMNS + [
+    'trnamt', 'incometype', 'total'
+]
+
+BALANCE_KEYS = [FREQ_COL, ACCTID_COL, 'name', 'baltype']
+BALANCE_VALUES = ['value', 'dtasof']
+BALANCE_COLUMNS = [ACCTID_COL, 'name', 'baltype', 'value', 'dtasof', 'date']
+
+# Rollup table -> source table
+ROLLUP_SOURCES = {
+    'flow_rollup': 'transactions',
+    'balance_rollup': 'balances',
+}
+
+# -----------------------------------------------------------------------------
+# -- Rollup delta methods
+# -----------------------------------------------------------------------------
+
+
+def period_labels(dates: pd.Series, freq: str) -> pd.Series:
+    """Label dates with their period.
+
+    Args:
+        dates: Dates or datetimes (strings or datetime objects).
+        freq: Period frequency (in PERIODS).
+
+    Returns:
+        pandas Series of period labels (e.g. 2020-05 for monthly periods).
+    """
+    return date_util.to_datetime(dates).dt.strftime(PERIODS[freq])
+
+
+def new_transactions(
+        transactions: pd.DataFrame, seen: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Drop transactions that were already rolled up.
+
+    Institutions resend overlapping transaction history on every download, so the same transaction
+    is stored by several runs. Keys are compared as strings: committed keys are read as strings
+    (see file_util.KEY_COLUMNS), so account numbers with leading zeros match the new records.
+
+    Args:
+        transactions: Transactions with acctid and fitid columns.
+        seen: Transactions (acctid, fitid) already rolled up.
+
+    Returns:
+        pandas DataFrame with the first occurrence of each transaction not in seen.
+    """
+    keys = transactions[_TRANSACTION_KEYS].astype(str)
+    is_new = ~keys.duplicated()
+    if seen is not None and len(seen):
+        seen_index = pd.MultiIndex.from_frame(seen[_TRANSACTION_KEYS].astype(str))
+        is_new &= ~pd.MultiIndex.from_frame(keys).isin(seen_index)
+    return transactions[is_new.to_numpy()]
+
+
+def flow_deltas(transactions: pd.DataFrame) -> pd.DataFrame:
+    """Roll up transactions by period and account.
+
+    inflow and outflow are the deposits and withdrawals of the account (bank transactions), fees
+    include commissions and loads, and dividends are the totals of dividend income transactions.
+
+    Args:
+        transactions: Transactions (see TRANSACTION_COLUMNS), deduplicated (see new_transactions).
+
+    Returns:
+        pandas DataFrame indexed by period with FLOW_KEYS and FLOW_VALUES columns.
+    """
+    transactions = transactions.reset_index(drop=True).reindex(columns=TRANSACTION_COLUMNS)
+    dates = transactions[_TRANSACTION_DATES[0]]
+    for col in _TRANSACTION_DATES[1:]:
+        dates = dates.fillna(transactions[col])
+    amounts = pd.to_numeric(transactions['trnamt'], errors='coerce').fillna(0)
+    is_dividend = transactions['incometype'] == _DIVIDEND_TYPE
+    values = pd.DataFrame({
+        ACCTID_COL: transactions[ACCTID_COL],
+        'inflow': amounts.clip(lower=0),
+        'outflow': amounts.clip(upper=0),
+        'net_flow': amounts,
+        'fees': transactions[_FEE_COLUMNS].apply(pd.to_numeric, errors='coerce').sum(axis=1),
+        'dividends': pd.to_numeric(transactions['total'], errors='coerce').abs().where(
+            is_dividend, 0).fillna(0),
+        'count': 1,
+    })
+    deltas = []
+    for freq in PERIODS:
+        freq_values = values.assign(**{PERIOD_COL: period_labels(dates, freq), FREQ_COL: freq})
+        deltas.append(
+            freq_values.groupby([PERIOD_COL] + FLOW_KEYS, sort=True)[FLOW_VALUES].sum())
+    return pd.concat(deltas).reset_index(level=FLOW_KEYS)
+
+
+def balance_deltas(balances: pd.DataFrame) -> pd.DataFrame:
+    """Roll up balances to the latest value by period, account and balance.
+
+    Args:
+        balances: Balances (see BALANCE_COLUMNS).
+
+    Returns:
+        pandas DataFrame indexed by period with BALANCE_KEYS and BALANCE_VALUES columns.
+    """
+    balances = balances.reset_index(drop=True).reindex(columns=BALANCE_COLUMNS)
+    balances['dtasof'] = date_util.to_datetime(balances['dtasof'].fillna(balances['date']))
+    deltas = []
+    for freq in PERIODS:
+        freq_balances = balances.assign(
+            **{PERIOD_COL: balances['dtasof'].dt.strftime(PERIODS[freq]), FREQ_COL: freq})
+        freq_balances = freq_balances.sort_values('dtasof', kind='stable')
+        freq_balances = freq_balances.drop_duplicates([PERIOD_COL] + BALANCE_KEYS, keep='last')
+        deltas.append(freq_balances.set_index(PERIOD_COL)[BALANCE_KEYS + BALANCE_VALUES])
+    deltas = pd.concat(deltas)
+    deltas['dtasof'] = deltas['dtasof'].dt.strftime('%Y-%m-%d %H:%M:%S%z')
+    return deltas
+
+
+# -----------------------------------------------------------------------------
+# -- Rollup write method
+# -----------------------------------------------------------------------------
+
+
+def _stage(
+        rollup_df: pd.DataFrame,
+        table: str,
+        txn: journal.Transaction,
+        replace: bool = False) -> None:
+    """Write a rollup delta to a new partition of the rollup table."""
+    if rollup_df.empty:
+        return
+    columns = [PERIOD_COL] + list(rollup_df.columns)
+    rollup_df.to_csv(
+        txn.stage_partition(table, columns=columns, rows=len(rollup_df), replace=replace))
+
+
+def write_rollups(tables: Dict[str, pd.DataFrame], txn: journal.Transaction) -> None:
+    """Add the deltas of the records written by a run to the rollup tables.
+
+    Only the records of the run are rolled up (plus the committed (acctid, fitid) keys used to
+    skip resent transactions, read from the memory-mapped copy). The first time a rollup is
+    written for a database that already has data, it is backfilled from the full source table.
+
+    Args:
+        tables: Table name -> records written by the run (see agg.write_records).
+        txn: Aggregation run transaction.
+
+    Returns:
+        None
+    """
+    db_dir = txn.db_dir
+    if 'transactions' in tables:
+        transactions = tables['transactions']
+        seen = None
+        if file_util.table_partitions('flow_rollup', db_dir=db_dir, manifest=txn.manifest):
+            if file_util.table_partitions('transactions', db_dir=db_dir, manifest=txn.manifest):
+                seen = file_util.read_mmap_table(
+                    'transactions', db_dir=db_dir, columns=_TRANSACTION_KEYS,
+                    manifest=txn.manifest)
+        else:
+            history = file_util.read_db_table(
+                'transactions', db_dir=db_dir, columns=TRANSACTION_COLUMNS,
+                manifest=txn.manifest)
+            transactions = pd.concat([history, transactions], sort=False)
+        _stage(flow_deltas(new_transactions(transactions, seen)), 'flow_rollup', txn)
+
+    if 'balances' in tables:
+        balances = tables['balances']
+        if not file_util.table_partitions('balance_rollup', db_dir=db_dir, manifest=txn.manifest):
+            history = file_util.read_db_table(
+                'balances', db_dir=db_dir, columns=BALANCE_COLUMNS, manifest=txn.manifest)
+            balances = pd.concat([history, balances], sort=False)
+        _stage(balance_deltas(balances), 'balance_rollup', txn)
+
+
+def rebuild_rollups(db_dir: str = cfg.DB_DIR) -> None:
+    """Rebuild the rollup tables from the full source tables.
+
+    Rollups that already have partitions are replaced, which is journaled as a rollback barrier
+    like a compaction (see journal.compact). Building missing rollups only appends.
+
+    Args:
+        db_dir: Database base directory path.
+
+    Returns:
+        None
+    """
+    with journal.Transaction(db_dir) as txn:
+        replace = {
+            table: bool(file_util.table_partitions(table, db_dir=db_dir, manifest=txn.manifest))
+            for table in ROLLUP_SOURCES
+        }
+        if file_util.table_partitions('transactions', db_dir=db_dir, manifest=txn.manifest):
+            transactions = file_util.read_db_table(
+                'transactions', db_dir=db_dir, columns=TRANSACTION_COLUMNS, manifest=txn.manifest)
+            _stage(flow_deltas(new_transactions(transactions)), 'flow_rollup', txn,
+                   replace=replace['flow_rollup'])
+        if file_util.table_partitions('balances', db_dir=db_dir, manifest=txn.manifest):
+            balances = file_util.read_db_table(
+                'balances', db_dir=db_dir, columns=BALANCE_COLUMNS, manifest=txn.manifest)
+            _stage(balance_deltas(balances), 'balance_rollup', txn,
+                   replace=replace['balance_rollup'])
+
+
+def missing_rollups(
+        tables: List[str],
+        db_dir: str = cfg.DB_DIR,
+        manifest: Optional[dict] = None) -> List[str]:
+    """Find rollup tables that have not been built although their source table has data.
+
+    Args:
+        tables: Table names.
+        db_dir: Database base directory path.
+        manifest: Table manifest snapshot (see file_util.read_manifest). Read from disk if None.
+
+    Returns:
+        Rollup table names (in ROLLUP_SOURCES) missing from the database.
+    """
+    if manifest is None:
+        manifest = file_util.read_manifest(db_dir)
+    return [
+        table for table in tables if table in ROLLUP_SOURCES and
+        not file_util.table_partitions(table, db_dir=db_dir, manifest=manifest) and
+        file_util.table_partitions(ROLLUP_SOURCES[table], db_dir=db_dir, manifest=manifest)
+    ]
+
+
+# -----------------------------------------------------------------------------
+# -- Rollup read methods
+# -----------------------------------------------------------------------------
+
+
+def combine_flows(
+        deltas: pd.DataFrame,
+        freq: str = 'M',
+        by: Optional[List[str]] = None) -> pd.DataFrame:
+    """Combine flow rollup deltas into flows by period and account.
+
+    Args:
+        deltas: Flow rollup table.
+        freq: Period frequency (in PERIODS).
+        by: Additional key columns of the deltas (e.g. tenant).
+
+    Returns:
+        pandas DataFrame indexed by period, by and acctid with FLOW_VALUES columns.
+    """
+    keys = [PERIOD_COL] + (by or []) + [ACCTID_COL]
+    deltas = deltas.reset_index().reindex(columns=keys + [FREQ_COL] + FLOW_VALUES)
+    deltas = deltas[deltas[FREQ_COL] == freq]
+    return deltas.groupby(keys, sort=True, observed=True)[FLOW_VALUES].sum()
+
+
+def combine_balances(
+        deltas: pd.DataFrame,
+        freq: str = 'M',
+        by: Optional[List[str]] = None) -> pd.DataFrame:
+    """Combine balance rollup deltas into the latest balances by period and account.
+
+    Args:
+        deltas: Balance rollup table.
+        freq: Period frequency (in PERIODS).
+        by: Additional key columns of the deltas (e.g. tenant).
+
+    Returns:
+        pandas DataFrame with period, by, BALANCE_KEYS and BALANCE_VALUES columns.
+    """
+    keys = [PERIOD_COL] + (by or []) + BALANCE_KEYS
+    deltas = deltas.reset_index().reindex(columns=keys + BALANCE_VALUES)
+    deltas = deltas[deltas[FREQ_COL] == freq]
+    deltas = deltas.assign(dtasof=date_util.to_datetime(deltas['dtasof']))
+    deltas = deltas.sort_values('dtasof', kind='stable')
+    return deltas.drop_duplicates(keys, keep='last').sort_values(keys).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    description = 'Show or rebuild the rollup tables.'
+    arg_parser = argparse.ArgumentParser(description=description)
+    arg_parser.add_argument(
+        '-tenant', type=str, default=None, nargs='+',
+        help='Tenant(s) to rebuild the rollups of. Uses the database directory itself if not set.')
+    arg_parser.add_argument(
+        '--rebuild',
+        dest='rebuild',
+        action='store_const',
+        const=True,
+        default=False,
+        help='Rebuild the rollup tables from the full source tables.')
+    args = arg_parser.parse_args()
+
+    shard_dirs = [cfg.DB_DIR] if args.tenant is None else [
+        file_util.tenant_dir(tenant_name) for tenant_name in args.tenant
+    ]
+    for shard_dir in shard_dirs:
+        if args.rebuild:
+            rebuild_rollups(db_dir=shard_dir)
+        for rollup_table, combine in [('flow_rollup', combine_flows),
+                                      ('balance_rollup', combine_balances)]:
+            print(combine(file_util.read_db_table(rollup_table, db_dir=shard_dir)))
@@ -0,0 +1,123 @@
+#!python
+"""Table schema registry module.
+
+Derives the columns of each table up front from the ofxtools model classes whose records are
+flattened into it (see agg.get_model_record). Columns that an institution sends but that are not
+in the registry are still written; they are recorded per partition in the table manifest (see
+ofxdb.utils.journal) instead of widening and rewriting existing partitions.
+"""
+from typing import Dict, List
+
+from ofxtools import models
+from ofxtools.models import SubAggregate
+
+# -----------------------------------------------------------------------------
+# -- Table model definitions
+# -----------------------------------------------------------------------------
+# Columns every record is seeded with by agg (acct_info). Statement records are also seeded with
+# the account record of the statement (see agg.process_statement_model), so statement tables
+# start with the account model columns.
+RUN_COLUMNS = ['date', 'datetime', 'server', 'user']
+ACCOUNT_MODELS = ['INVACCTFROM', 'BANKACCTFROM', 'CCACCTFROM']
+
+# Bank and credit card statements hold STMTTRN transactions. Investment transactions are
+# registered by their own models, which flatten their INVTRAN (and INVBANKTRAN its STMTTRN).
+TABLE_MODELS = {
+    'acct_info': ACCOUNT_MODELS,
+    'transactions': ACCOUNT_MODELS + ['STMTTRN'] + [
+        'BUYDEBT', 'BUYMF', 'BUYOPT', 'BUYOTHER', 'BUYSTOCK', 'CLOSUREOPT', 'INCOME',
+        'INVEXPENSE', 'JRNLFUND', 'JRNLSEC', 'MARGININTEREST', 'REINVEST', 'RETOFCAP',
+        'SELLDEBT', 'SELLMF', 'SELLOPT', 'SELLOTHER', 'SELLSTOCK', 'SPLIT', 'TRANSFER',
+        'INVBANKTRAN',
+    ],
+    'positions': ACCOUNT_MODELS + ['POSDEBT', 'POSMF', 'POSOPT', 'POSOTHER', 'POSSTOCK'],
+    'balances': ACCOUNT_MODELS + ['BAL'],
+    'securities': ['DEBTINFO', 'MFINFO', 'OPTINFO', 'OTHERINFO', 'STOCKINFO'],
+}
+
+# -----------------------------------------------------------------------------
+# -- Schema registry methods
+# -----------------------------------------------------------------------------
+
+
+def model_columns(model: type) -> List[str]:
+    """Get the flattened record columns of an ofxtools model class.
+
+    Walks the model spec the same way agg.append_model_records walks model instances: sub
+    aggregates are flattened into their leaf elements.
+
+    Args:
+        model: ofxtools Aggregate subclass.
+
+    Returns:
+        List of column names in spec order.
+    """
+    columns = []
+    for name, element in model.spec.items():
+        if isinstance(element, SubAggregate):
+            sub_columns = model_columns(element.aggregate_type)
+        else:
+            sub_columns = [name]
+        columns += [col for col in sub_columns if col not in columns]
+    return columns
+
+
+def build_registry() -> Dict[str, List[str]]:
+    """Build the table -> columns registry from the ofxtools model classes.
+
+    Returns:
+        Table name -> list of column names (run columns first, then model columns).
+    """
+    registry = {}
+    for table, model_names in TABLE_MODELS.items():
+        columns = list(RUN_COLUMNS)
+        for model_name in model_names:
+            model = getattr(models, model_name, None)
+            if model is None:
+                # Not every ofxtools version defines every model.
+                continue
+            columns += [col for col in model_columns(model) if col not in columns]
+        registry[table] = columns
+    registry['account_info'] = registry['acct_info']
+    return registry
+
+
+SCHEMAS = build_registry()
+
+
+def get_schema(table: str) -> List[str]:
+    """Retrieve registered columns of a table.
+
+    Args:
+        table: Table name.
+
+    Returns:
+        List of column names.
+
+    Raises:
+        ValueError: Encountered table that was not supported (in SCHEMAS).
+    """
+    table = table.lower()
+    if table not in SCHEMAS:
+        raise ValueError(f'Table ({table}) not supported. Try: {list(SCHEMAS.keys())}.')
+    return SCHEMAS[table]
+
+
+def order_columns(table: str, columns: List[str]) -> List[str]:
+    """Order columns by the table schema, unregistered columns last (in the given order).
+
+    Args:
+        table: Table name.
+        columns: Column names.
+
+    Returns:
+        Ordered list of column names.
+    """
+    schema = get_schema(table)
+    registered = [col for col in schema if col in columns]
+    return registered + [col for col in columns if col not in schema]
+
+
+if __name__ == '__main__':
+    for schema_table, schema_columns in SCHEMAS.items():
+        print(schema_table, schema_columns)
@@ -0,0 +1,130 @@
+#!python
+"""Multi-tenant database module.
+
+A tenant is a household or user with its own ofxget config. Every tenant gets a complete database
+directory in a sharded layout (see file_util.tenant_dir), so tenants never share table files,
+manifests or journal locks and can be aggregated concurrently.
+
+The runner extracts and aggregates many tenants in parallel, capped by a single worker pool, so
+one deployment can serve hundreds of tenants without opening hundreds of institution connections
+or aggregation processes at once.
+"""
+import os
+import shutil
+import argparse
+import concurrent.futures
+from typing import Dict, List, Optional
+
+from ofxdb.data import extarct, agg
+from ofxdb.utils import file_util
+from ofxdb import cfg
+
+# -----------------------------------------------------------------------------
+# -- Tenant setup method
+# -----------------------------------------------------------------------------
+
+
+def add_tenant(tenant: str, cfg_file: str, db_dir: str = cfg.DB_DIR) -> str:
+    """Add a tenant (or replace its config) by copying an ofxget config file to its directory.
+
+    Args:
+        tenant: Tenant name.
+        cfg_file: ofxget config file of the tenant.
+        db_dir: Database base directory path.
+
+    Returns:
+        A string representing full path of the tenant database directory.
+    """
+    tenant_cfg_file = file_util.tenant_cfg_file(tenant, db_dir=db_dir)
+    if not os.path.exists(os.path.dirname(tenant_cfg_file)):
+        os.makedirs(os.path.dirname(tenant_cfg_file))
+    shutil.copyfile(cfg_file, tenant_cfg_file)
+    return file_util.tenant_dir(tenant, db_dir=db_dir)
+
+
+# -----------------------------------------------------------------------------
+# -- Tenant run methods
+# -----------------------------------------------------------------------------
+MAX_WORKERS = os.cpu_count() or 1
+
+
+def run_tenant(tenant: str, db_dir: str = cfg.DB_DIR, extract: bool = True) -> str:
+    """Extract and aggregate the data of a single tenant.
+
+    Args:
+        tenant: Tenant name.
+        db_dir: Database base directory path.
+        extract: Fetch new ofx files before aggregating.
+
+    Returns:
+        Tenant name.
+    """
+    tenant_db_dir = file_util.tenant_dir(tenant, db_dir=db_dir)
+    if extract:
+        extarct.extract(
+            db_dir=tenant_db_dir, config_home=file_util.tenant_config_home(tenant, db_dir=db_dir))
+    agg.agg(db_dir=tenant_db_dir, cfg_file=file_util.tenant_cfg_file(tenant, db_dir=db_dir))
+    return tenant
+
+
+def run_tenants(
+        tenants: Optional[List[str]] = None,
+        db_dir: str = cfg.DB_DIR,
+        max_workers: int = MAX_WORKERS,
+        extract: bool = True) -> Dict[str, Optional[Exception]]:
+    """Extract and aggregate the data of many tenants in parallel.
+
+    Tenants are run in worker processes (parsing ofx files is CPU bound) and at most max_workers
+    tenants are processed at once. Each tenant run is transactional (see ofxdb.utils.journal), so a
+    failing tenant leaves its tables untouched and does not stop the other tenants.
+
+    Args:
+        tenants: Tenant names. Defaults to all tenants (see file_util.list_tenants).
+        db_dir: Database base directory path.
+        max_workers: Maximum number of tenants processed concurrently.
+        extract: Fetch new ofx files before aggregating.
+
+    Returns:
+        Tenant name -> exception raised by the tenant run (None if the run succeeded).
+    """
+    if tenants is None:
+        tenants = file_util.list_tenants(db_dir)
+    results: Dict[str, Optional[Exception]] = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_tenant, tenant, db_dir, extract): tenant for tenant in tenants
+        }
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.exception()
+    return {tenant: results[tenant] for tenant in tenants}
+
+
+if __name__ == '__main__':
+    description = 'Add tenants or extract and aggregate their data.'
+    arg_parser = argparse.ArgumentParser(description=description)
+    arg_parser.add_argument(
+        '-tenant', type=str, default=None, nargs='+',
+        help='Tenant(s) to run. All tenants are run if not set.')
+    arg_parser.add_argument(
+        '-add', type=str, default=None, nargs=2, metavar=('TENANT', 'CFG_FILE'),
+        help='Add a tenant with its ofxget config file.')
+    arg_parser.add_argument(
+        '-workers', type=int, default=MAX_WORKERS,
+        help='Maximum number of tenants processed concurrently.')
+    arg_parser.add_argument(
+        '--no-extract',
+        dest='extract',
+        action='store_const',
+        const=False,
+        default=True,
+        help='Aggregate the current ofx files without fetching new ones.')
+    args = arg_parser.parse_args()
+
+    if args.add is not None:
+        print(add_tenant(*args.add))
+    else:
+        run_results = run_tenants(args.tenant, max_workers=args.workers, extract=args.extract)
+        for tenant_name, error in run_results.items():
+            print(tenant_name, 'ok' if error is None else f'failed: {error!r}')
+        if any(error is not None for error in run_results.values()):
+            arg_parser.exit(1)
@@ -0,0 +1,234 @@
+#!python
+"""Exposure engine module.
+
+Computes factor exposures of positions for all accounts and dates at once.
+
+Positions are int-coded by security and by output group (e.g. date and account). Each position is
+matched to an exposure row (the latest row for its security that is effective on the position
+date), so the aggregate exposure is the product of a sparse position -> exposure row matrix with
+the dense exposure row x factor matrix. The sparse product is evaluated with one np.bincount per
+factor, so adding factors adds one vectorized pass instead of another merge.
+
+Fund holdings are looked through before exposures are matched: a position in a fund that has
+holdings is split into one position per holding, weighted by the holding weight.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ofxdb.utils import date_util
+
+# -----------------------------------------------------------------------------
+# -- Exposure table column definitions
+# -----------------------------------------------------------------------------
+TICKER_COL = 'ticker'
+DATE_COL = 'date'
+VALUE_COL = 'mktval'
+FUND_COL = 'fund'
+WEIGHT_COL = 'weight'
+
+
+def factor_columns(exposures: pd.DataFrame) -> List[str]:
+    """Get factor columns of an exposures table.
+
+    Factors are all numeric columns other than the effective date.
+
+    Args:
+        exposures: Exposures table.
+
+    Returns:
+        List of factor column names.
+    """
+    return [
+        col for col in exposures.select_dtypes(include='number').columns
+        if col not in (TICKER_COL, DATE_COL)
+    ]
+
+
+# -----------------------------------------------------------------------------
+# -- Exposure engine helper methods
+# -----------------------------------------------------------------------------
+# Exposure rows without an effective date apply to all dates.
+_STATIC_DATE = np.iinfo(np.int64).min
+
+
+def date_ordinals(dates: pd.Series) -> np.ndarray:
+    """Convert dates to integer day ordinals.
+
+    Args:
+        dates: Date strings, dates or datetimes (see date_util.to_datetime). Missing dates are
+               treated as static.
+
+    Returns:
+        int64 array of days since epoch. Missing dates are set to the static date sentinel.
+    """
+    days = date_util.to_datetime(dates).dt.floor('D')
+    ordinals = (days - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(days=1)
+    return ordinals.fillna(_STATIC_DATE).to_numpy(dtype=np.int64)
+
+
+def look_through(
+        securities: np.ndarray,
+        values: np.ndarray,
+        funds: np.ndarray,
+        holdings: np.ndarray,
+        weights: np.ndarray,
+        n_securities: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Expand fund positions into weighted positions in the fund holdings.
+
+    Args:
+        securities: Security code for each position.
+        values: Value for each position.
+        funds: Fund security code for each fund holding.
+        holdings: Held security code for each fund holding.
+        weights: Weight of each fund holding.
+        n_securities: Number of security codes.
+
+    Returns:
+        Tuple of (source position index, security code, value) for each expanded position.
+        Positions in securities without holdings are passed through unchanged.
+    """
+    if len(funds) == 0:
+        return np.arange(len(securities)), securities, values
+    order = np.argsort(funds, kind='stable')
+    funds, holdings, weights = funds[order], holdings[order], weights[order]
+    counts = np.bincount(funds, minlength=n_securities)
+    starts = np.cumsum(counts) - counts
+
+    is_fund = counts[securities] > 0
+    repeats = np.where(is_fund, counts[securities], 1)
+    rows = np.repeat(np.arange(len(securities)), repeats)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+
+    row_is_fund = is_fund[rows]
+    holding_idx = np.where(row_is_fund, starts[securities[rows]] + offsets, 0)
+    expanded_securities = np.where(row_is_fund, holdings[holding_idx], securities[rows])
+    expanded_values = values[rows] * np.where(row_is_fund, weights[holding_idx], 1.0)
+    return rows, expanded_securities, expanded_values
+
+
+def match_exposures(
+        securities: np.ndarray,
+        dates: np.ndarray,
+        exposure_securities: np.ndarray,
+        exposure_dates: np.ndarray) -> np.ndarray:
+    """Match positions to the latest exposure row effective on the position date.
+
+    Args:
+        securities: Security code for each position.
+        dates: Date ordinal for each position.
+        exposure_securities: Security code for each exposure row.
+        exposure_dates: Effective date ordinal for each exposure row (static sentinel if none).
+
+    Returns:
+        Exposure row index for each position, -1 where no exposure row matches.
+    """
+    if len(exposure_securities) == 0:
+        return np.full(len(securities), -1, dtype=np.int64)
+    dated = exposure_dates != _STATIC_DATE
+    all_dates = np.concatenate([dates, exposure_dates[dated]])
+    min_date = all_dates.min() if len(all_dates) else 0
+    span = (all_dates.max() - min_date + 2) if len(all_dates) else 1
+
+    # Composite (security, date) keys; static rows sort before every dated row of the security.
+    exposure_keys = exposure_securities * span + np.where(dated, exposure_dates - min_date + 1, 0)
+    order = np.argsort(exposure_keys, kind='stable')
+    position_keys = securities * span + (dates - min_date + 1)
+
+    idx = np.searchsorted(exposure_keys[order], position_keys, side='right') - 1
+    matched = (idx >= 0) & (exposure_securities[order][np.maximum(idx, 0)] == securities)
+    return np.where(matched, order[np.maximum(idx, 0)], -1)
+
+
+# -----------------------------------------------------------------------------
+# -- Exposure engine
+# -----------------------------------------------------------------------------
+
+
+def compute_exposures(
+        positions: pd.DataFrame,
+        exposures: pd.DataFrame,
+        group_by: List[str],
+        factors: Optional[List[str]] = None,
+        fund_holdings: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Compute value weighted factor exposures.
+
+    1) Int-code securities and output groups.
+    2) Look through fund positions into their holdings.
+    3) Match each position to its effective exposure row.
+    4) Aggregate value x factor for every factor (sparse position x exposure product).
+
+    Args:
+        positions: Positions with ticker, date, mktval and group_by columns.
+        exposures: Exposures with ticker (column or index), factor columns and an optional
+                   effective date column. Rows without a date apply to all dates.
+        group_by: Position columns to aggregate exposures by (e.g. date, acctid). Positions with
+                  missing group_by values are dropped.
+        factors: Factor columns. Defaults to all numeric exposure columns (see factor_columns).
+        fund_holdings: Fund holdings with fund (column or index), ticker and weight columns used
+                       for look-through.
+
+    Returns:
+        pandas DataFrame indexed by group_by with the aggregate mktval and one column per factor
+        holding the value weighted exposure to that factor. Positions without a matching exposure
+        row contribute to mktval but not to the factor columns.
+    """
+    if TICKER_COL not in exposures.columns:
+        exposures = exposures.reset_index()
+    if factors is None:
+        factors = factor_columns(exposures)
+    if fund_holdings is None:
+        fund_holdings = pd.DataFrame(columns=[FUND_COL, TICKER_COL, WEIGHT_COL])
+    if FUND_COL not in fund_holdings.columns:
+        fund_holdings = fund_holdings.reset_index()
+    positions = positions.dropna(subset=group_by)
+    exposures = exposures.dropna(subset=[TICKER_COL])
+    fund_holdings = fund_holdings.dropna(subset=[FUND_COL, TICKER_COL])
+
+    # Positions with unknown tickers share one extra code that has no exposures or holdings.
+    tickers = pd.concat([
+        positions[TICKER_COL], exposures[TICKER_COL],
+        fund_holdings[FUND_COL], fund_holdings[TICKER_COL]
+    ], ignore_index=True)
+    ticker_codes, ticker_index = pd.factorize(tickers)
+    n_securities = len(ticker_index) + 1
+    ticker_codes = np.where(ticker_codes < 0, n_securities - 1, ticker_codes).astype(np.int64)
+    splits = np.cumsum([len(positions), len(exposures), len(fund_holdings)])
+    securities, exposure_securities, funds, holdings = np.split(ticker_codes, splits)
+
+    grouper = positions.groupby(group_by, sort=True, observed=True)
+    group_codes = grouper.ngroup().to_numpy()
+    group_index = grouper.size().index
+    values = positions[VALUE_COL].to_numpy(dtype=np.float64)
+
+    rows, securities, expanded_values = look_through(
+        securities=securities,
+        values=values,
+        funds=funds,
+        holdings=holdings,
+        weights=fund_holdings[WEIGHT_COL].to_numpy(dtype=np.float64),
+        n_securities=n_securities)
+
+    if DATE_COL in exposures.columns:
+        exposure_dates = date_ordinals(exposures[DATE_COL])
+    else:
+        exposure_dates = np.full(len(exposures), _STATIC_DATE, dtype=np.int64)
+    exposure_idx = match_exposures(
+        securities=securities,
+        dates=date_ordinals(positions[DATE_COL])[rows],
+        exposure_securities=exposure_securities,
+        exposure_dates=exposure_dates)
+
+    factor_matrix = np.nan_to_num(exposures[factors].to_numpy(dtype=np.float64))
+    factor_matrix = np.vstack([factor_matrix, np.zeros((1, len(factors)))])
+    weighted = expanded_values[:, None] * factor_matrix[exposure_idx]
+
+    n_groups = len(group_index)
+    result = {
+        VALUE_COL: np.bincount(group_codes, weights=np.nan_to_num(values), minlength=n_groups)
+    }
+    for i, factor in enumerate(factors):
+        result[factor] = np.bincount(
+            group_codes[rows], weights=np.nan_to_num(weighted[:, i]), minlength=n_groups)
+    return pd.DataFrame(result, index=group_index)
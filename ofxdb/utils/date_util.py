@@ -0,0 +1,23 @@
+#!python
+"""Library of date utility methods."""
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# -- Date parsing methods
+# -----------------------------------------------------------------------------
+
+
+def to_datetime(dates: pd.Series) -> pd.Series:
+    """Parse dates and datetimes to UTC datetimes.
+
+    Date columns mix datetimes with dates where a missing datetime was filled from the record date
+    (e.g. 2020-05-01 next to 2020-05-01 00:00:00+00:00), so every ISO 8601 value is parsed on its
+    own rather than with a format inferred from the first one.
+
+    Args:
+        dates: Dates or datetimes (ISO 8601 strings or datetime objects). Missing values are NaT.
+
+    Returns:
+        pandas Series of UTC datetimes.
+    """
+    return pd.to_datetime(pd.Series(dates), utc=True, format='ISO8601')
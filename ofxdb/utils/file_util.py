@@ -1,8 +1,22 @@
 #!python
 """Library of file utility methods."""
 import os
+import json
+import glob
+import time
+import re
+import hashlib
 import pathlib
+import contextlib
+from typing import IO, Dict, Iterator, List, Optional, Tuple
 
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
 import pandas as pd
 
 from ofxdb import cfg
@@ -18,14 +32,148 @@ TABLES = {
     'acct_info': 'account_info.csv',
     'account_info': 'account_info.csv',
     'positions': 'positions.csv',
+    'flow_rollup': 'flow_rollup.csv',
+    'balance_rollup': 'balance_rollup.csv',
 }
 AUX_TABLES = {
     'exposures': 'exposures.csv',
+    'fund_holdings': 'fund_holdings.csv',
 }
 
 
+# -----------------------------------------------------------------------------
+# -- Tenant directory methods
+# -----------------------------------------------------------------------------
+TENANTS_FOLDER = 'tenants'
+TENANT_CONFIG_HOME = 'config'
+_TENANT_SHARD_CHARS = 2
+_TENANT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.@-]*$')
+
+
+def tenant_dir(tenant: str, db_dir: str = cfg.DB_DIR) -> str:
+    """Retrieve the database directory of a tenant (household or user).
+
+    Tenants are sharded by a hash prefix of their name so that no folder holds more than a few
+    hundred entries:
+    db_dir/tenants/<2 hex chars>/<tenant>/
+
+    Each tenant directory is a complete database directory (stmt files, tables, manifest and
+    journal) with its own ofxtools config home (see tenant_config_home).
+
+    Args:
+        tenant: Tenant name.
+        db_dir: Database base directory path.
+
+    Returns:
+        A string representing full path of the tenant database directory.
+
+    Raises:
+        ValueError: Encountered tenant name that is not a valid folder name.
+    """
+    if _TENANT_NAME.match(tenant) is None:
+        raise ValueError(
+            f'Tenant ({tenant}) not supported. Tenant names must start with a letter or digit and '
+            f'only contain letters, digits, "_", ".", "@" or "-".'
+        )
+    shard = hashlib.sha1(tenant.encode()).hexdigest()[:_TENANT_SHARD_CHARS]
+    return f'{db_dir}/{TENANTS_FOLDER}/{shard}/{tenant}'
+
+
+def tenant_config_home(tenant: str, db_dir: str = cfg.DB_DIR) -> str:
+    """Retrieve the ofxtools config home of a tenant.
+
+    ofxget is run with its config home set to this folder (see extarct.config_env), so it reads
+    the server settings of the tenant rather than the global ofxget.cfg.
+
+    Args:
+        tenant: Tenant name.
+        db_dir: Database base directory path.
+
+    Returns:
+        A string representing full path of the tenant config home.
+    """
+    return f'{tenant_dir(tenant, db_dir=db_dir)}/{TENANT_CONFIG_HOME}'
+
+
+def tenant_cfg_file(tenant: str, db_dir: str = cfg.DB_DIR) -> str:
+    """Retrieve full path of the ofxget config file of a tenant.
+
+    Args:
+        tenant: Tenant name.
+        db_dir: Database base directory path.
+
+    Returns:
+        A string representing full path of the tenant config file.
+    """
+    return (
+        f'{tenant_config_home(tenant, db_dir=db_dir)}/'
+        f'{cfg.OFXGET_CFG_FOLDER}/{cfg.OFXGET_CFG_NAME}'
+    )
+
+
+def list_tenants(db_dir: str = cfg.DB_DIR) -> List[str]:
+    """List the tenants of a database directory.
+
+    Args:
+        db_dir: Database base directory path.
+
+    Returns:
+        Sorted list of tenant names.
+    """
+    cfg_files = glob.glob(
+        f'{db_dir}/{TENANTS_FOLDER}/*/*/{TENANT_CONFIG_HOME}/'
+        f'{cfg.OFXGET_CFG_FOLDER}/{cfg.OFXGET_CFG_NAME}'
+    )
+    return sorted(pathlib.Path(cfg_file).parents[2].name for cfg_file in cfg_files)
+
+
+# -----------------------------------------------------------------------------
+# -- Table directory methods
+# -----------------------------------------------------------------------------
+TABLES_FOLDER = 'tables'
+MANIFEST = 'MANIFEST.json'
+
+
+def tables_dir(db_dir: str = cfg.DB_DIR) -> str:
+    """Retrieve full path for the tables folder, creating it if needed.
+
+    Args:
+        db_dir: Database base directory path.
+
+    Returns:
+        A string representing full path for the tables folder.
+    """
+    base_path = f'{db_dir}/{TABLES_FOLDER}'
+    if not os.path.exists(base_path):
+        os.makedirs(base_path)
+    return base_path
+
+
+def read_manifest(db_dir: str = cfg.DB_DIR) -> dict:
+    """Read the table manifest written by the last committed aggregation run.
+
+    The manifest lists the partitions of each table file (in TABLES), with the columns of every
+    partition, and keeps a journal of recent runs (see ofxdb.utils.journal). Reading the manifest
+    once and passing it to the read methods gives a consistent snapshot of all tables.
+
+    Args:
+        db_dir: Database base directory path.
+
+    Returns:
+        Manifest dict (tables, history). Empty if no run has been committed yet.
+    """
+    manifest_file = f'{tables_dir(db_dir)}/{MANIFEST}'
+    if not os.path.exists(manifest_file):
+        return {'tables': {}, 'history': []}
+    with open(manifest_file, 'r') as file_buffer:
+        return json.load(file_buffer)
+
+
 def table_file(table: str, db_dir: str = cfg.DB_DIR) -> str:
-    """Retrieve full path for a given table.
+    """Retrieve full path for the base file of a given table.
+
+    Tables written before the run journal existed are stored in the base file. Partitions written
+    by aggregation runs are named after it (see table_partitions).
 
     Args:
         table: Table name for file to retrieve.
@@ -37,9 +185,7 @@ def table_file(table: str, db_dir: str = cfg.DB_DIR) -> str:
     Raises:
         ValueError: Encountered table that was not supported (in TABLES).
     """
-    base_path = f'{db_dir}/tables'
-    if not os.path.exists(base_path):
-        os.makedirs(base_path)
+    base_path = tables_dir(db_dir)
     table = table.lower()
     if table not in TABLES:
         raise ValueError(
@@ -49,6 +195,37 @@ def table_file(table: str, db_dir: str = cfg.DB_DIR) -> str:
     return f'{base_path}/{TABLES.get(table)}'
 
 
+def table_partitions(
+        table: str, db_dir: str = cfg.DB_DIR, manifest: Optional[dict] = None) -> List[dict]:
+    """Retrieve the partitions of a given table.
+
+    Args:
+        table: Table name (in TABLES).
+        db_dir: Database base directory path.
+        manifest: Table manifest snapshot (see read_manifest). Read from disk if None.
+
+    Returns:
+        List of partition dicts (file, columns, rows) in write order, with full file paths.
+        columns and rows are None for partitions written before columns were tracked.
+    """
+    base_file = table_file(table, db_dir=db_dir)
+    base_path = os.path.dirname(base_file)
+    if manifest is None:
+        manifest = read_manifest(db_dir)
+    entry = manifest['tables'].get(os.path.basename(base_file))
+    if entry is None:
+        if os.path.exists(base_file):
+            return [{'file': base_file, 'columns': None, 'rows': None}]
+        return []
+    if isinstance(entry, str):
+        # Single file table version (manifests written before tables were partitioned)
+        return [{'file': f'{base_path}/{entry}', 'columns': None, 'rows': None}]
+    return [
+        {**partition, 'file': f'{base_path}/{partition["file"]}'}
+        for partition in entry['partitions']
+    ]
+
+
 def aux_table_file(table: str, aux_dir: str = cfg.AUX_TABLES_DIR) -> str:
     """Retrieve full path for a given system table (part of the repo).
 
@@ -74,89 +251,581 @@ def aux_table_file(table: str, aux_dir: str = cfg.AUX_TABLES_DIR) -> str:
     return f'{aux_dir}/{AUX_TABLES.get(table)}'
 
 
+# -----------------------------------------------------------------------------
+# -- File lock methods
+# -----------------------------------------------------------------------------
+# flock is used on posix. msvcrt locks (windows) have no shared mode, so shared locks are exclusive
+# there, and they do not block, so they are polled.
+_LOCK_POLL_SECONDS = 0.05
+
+
+def lock_file(file_buffer: IO, shared: bool = False) -> None:
+    """Block until an advisory lock on an open file is acquired.
+
+    Args:
+        file_buffer: Open lock file.
+        shared: Acquire a shared (read) lock instead of an exclusive one.
+
+    Returns:
+        None
+    """
+    if fcntl is not None:
+        fcntl.flock(file_buffer, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return
+    while True:
+        file_buffer.seek(0)
+        try:
+            msvcrt.locking(file_buffer.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            time.sleep(_LOCK_POLL_SECONDS)
+
+
+def unlock_file(file_buffer: IO) -> None:
+    """Release the lock on an open file (see lock_file).
+
+    Args:
+        file_buffer: Open lock file.
+
+    Returns:
+        None
+    """
+    if fcntl is not None:
+        fcntl.flock(file_buffer, fcntl.LOCK_UN)
+        return
+    file_buffer.seek(0)
+    msvcrt.locking(file_buffer.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def locked(file_name: str, shared: bool = False) -> Iterator[IO]:
+    """Hold a lock on a lock file (created if needed) for the duration of a with block.
+
+    Args:
+        file_name: Lock file path.
+        shared: Acquire a shared (read) lock instead of an exclusive one.
+
+    Returns:
+        Open lock file.
+    """
+    with open(file_name, 'a') as file_buffer:
+        lock_file(file_buffer, shared=shared)
+        try:
+            yield file_buffer
+        finally:
+            unlock_file(file_buffer)
+
+
+# -----------------------------------------------------------------------------
+# -- Memory-mapped table methods
+# -----------------------------------------------------------------------------
+# Numeric columns are stored as raw float64 arrays and key columns as int32 codes with the
+# categories kept in the meta.json sidecar. Arrays are read with np.memmap so that every process
+# reading a table shares the OS page cache instead of parsing its own copy of the csv.
+#
+# The copy is append-only: partitions are immutable, so new partitions are appended to the arrays
+# and meta.json (replaced last) records which partitions, and how many rows, the arrays hold.
+MMAP_COLUMNS = {
+    'positions': ['units', 'unitprice', 'mktval'],
+    'transactions': ['units', 'unitprice', 'total'],
+}
+MMAP_KEYS = {
+    'positions': ['date', 'acctid', 'uniqueid', 'uniqueidtype', 'heldinacct', 'postype'],
+    'transactions': ['date', 'acctid', 'uniqueid', 'uniqueidtype', 'fitid'],
+}
+_MMAP_EXTENSION = 'mmap'
+_MMAP_META = 'meta.json'
+_MMAP_LOCK = '.lock'
+_MMAP_VALUE_DTYPE = 'float64'
+_MMAP_CODE_DTYPE = 'int32'
+# Bumped when the layout changes; copies written in another format are rebuilt. Format 2: key
+# categories are strings (see KEY_COLUMNS).
+_MMAP_FORMAT = 2
+
+
+def mmap_dir(table: str, db_dir: str = cfg.DB_DIR) -> str:
+    """Retrieve full path for the memory-mapped copy of a given table.
+
+    Args:
+        table: Table name (in MMAP_COLUMNS).
+        db_dir: Database base directory path.
+
+    Returns:
+        A string representing full path for the memory-mapped table folder.
+
+    Raises:
+        ValueError: Encountered table that was not supported (in MMAP_COLUMNS).
+    """
+    table = table.lower()
+    if table not in MMAP_COLUMNS:
+        raise ValueError(
+            f'Table ({table}) not supported for memory mapping. Try: {list(MMAP_COLUMNS.keys())} '
+            f'or add support in {pathlib.Path(__file__).absolute()}.'
+        )
+    return f'{os.path.splitext(table_file(table, db_dir=db_dir))[0]}.{_MMAP_EXTENSION}'
+
+
+def _write_atomic(file_name: str, data: bytes) -> None:
+    """Write bytes to a temporary file and rename it into place."""
+    tmp_name = f'{file_name}.{os.getpid()}.tmp'
+    with open(tmp_name, 'wb') as file_buffer:
+        file_buffer.write(data)
+    os.replace(tmp_name, file_name)
+
+
+def read_mmap_meta(table: str, db_dir: str = cfg.DB_DIR) -> dict:
+    """Read meta data of the memory-mapped copy of a table.
+
+    Args:
+        table: Table name (in MMAP_COLUMNS).
+        db_dir: Database base directory path.
+
+    Returns:
+        Meta data dict (format, token, partitions, partition_rows, rows, columns, keys).
+
+    Raises:
+        FileNotFoundError: Memory-mapped copy has not been written (see write_mmap).
+    """
+    meta_file = f'{mmap_dir(table, db_dir=db_dir)}/{_MMAP_META}'
+    if not os.path.exists(meta_file):
+        raise FileNotFoundError(f'Could not find memory-mapped table at: {meta_file}')
+    with open(meta_file, 'r') as file_buffer:
+        return json.load(file_buffer)
+
+
+def _covers(meta: Optional[dict], partition_files: List[str]) -> bool:
+    """Check if a memory-mapped copy starts with the given partitions."""
+    return (
+        meta is not None and meta.get('format') == _MMAP_FORMAT and
+        meta['partitions'][:len(partition_files)] == partition_files
+    )
+
+
+def is_mmap_current(
+        table: str, db_dir: str = cfg.DB_DIR, manifest: Optional[dict] = None) -> bool:
+    """Check if the memory-mapped copy of a table holds all partitions of the table.
+
+    Args:
+        table: Table name (in MMAP_COLUMNS).
+        db_dir: Database base directory path.
+        manifest: Table manifest snapshot (see read_manifest). Read from disk if None.
+
+    Returns:
+        True or False
+    """
+    try:
+        meta = read_mmap_meta(table, db_dir=db_dir)
+    except FileNotFoundError:
+        return False
+    partitions = table_partitions(table, db_dir=db_dir, manifest=manifest)
+    return _covers(meta, [os.path.basename(partition['file']) for partition in partitions])
+
+
+def write_mmap(table: str, db_dir: str = cfg.DB_DIR, manifest: Optional[dict] = None) -> dict:
+    """Write the partitions of a table that are missing from its memory-mapped copy.
+
+    Only partitions that are not in the copy yet are read and appended, so refreshing after an
+    aggregation run is O(new data). The copy is rewritten from scratch if it does not start with
+    the table partitions (e.g. after a rollback or compaction).
+
+    Args:
+        table: Table name (in MMAP_COLUMNS).
+        db_dir: Database base directory path.
+        manifest: Table manifest snapshot (see read_manifest). Read from disk if None.
+
+    Returns:
+        Meta data dict of the memory-mapped copy (see read_mmap_meta).
+    """
+    table = table.lower()
+    folder = mmap_dir(table, db_dir=db_dir)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    partitions = table_partitions(table, db_dir=db_dir, manifest=manifest)
+    partition_files = [os.path.basename(partition['file']) for partition in partitions]
+
+    with locked(f'{folder}/{_MMAP_LOCK}'):
+        try:
+            meta = read_mmap_meta(table, db_dir=db_dir)
+        except FileNotFoundError:
+            meta = None
+        if meta is not None and meta.get('format') != _MMAP_FORMAT:
+            meta = None
+        if meta is not None and partition_files[:len(meta['partitions'])] == meta['partitions']:
+            start = len(meta['partitions'])
+        elif _covers(meta, partition_files):
+            # Copy already holds these partitions (and partitions committed after the snapshot).
+            return meta
+        else:
+            start = 0
+            meta = {
+                'format': _MMAP_FORMAT, 'token': f'{os.getpid()}-{time.time_ns()}',
+                'partitions': [],
+                'partition_rows': [], 'rows': 0,
+                'columns': {col: _MMAP_VALUE_DTYPE for col in MMAP_COLUMNS[table]},
+                'keys': {col: [] for col in MMAP_KEYS[table]},
+            }
+        if start >= len(partitions):
+            return meta
+
+        files = {
+            col: f'{folder}/{col}.{meta["token"]}.bin'
+            for col in MMAP_COLUMNS[table] + MMAP_KEYS[table]
+        }
+        lookups = {col: {key: i for i, key in enumerate(meta['keys'][col])} for col in meta['keys']}
+        for col, file_name in files.items():
+            # Drop anything a crashed refresh appended past the rows recorded in meta.json.
+            itemsize = np.dtype(meta['columns'].get(col, _MMAP_CODE_DTYPE)).itemsize
+            with open(file_name, 'ab') as file_buffer:
+                file_buffer.truncate(meta['rows'] * itemsize)
+
+        for partition in partitions[start:]:
+            partition_df = read_table(
+                partition['file'], columns=MMAP_KEYS[table] + MMAP_COLUMNS[table])
+            arrays = {
+                col: partition_df[col].to_numpy(dtype=_MMAP_VALUE_DTYPE)
+                for col in MMAP_COLUMNS[table]
+            }
+            for col in MMAP_KEYS[table]:
+                codes, uniques = pd.factorize(partition_df[col])
+                lookup = lookups[col]
+                for key in uniques.tolist():
+                    if key not in lookup:
+                        lookup[key] = len(lookup)
+                        meta['keys'][col].append(key)
+                mapping = np.array([lookup[key] for key in uniques.tolist()] + [-1])
+                arrays[col] = mapping[codes].astype(_MMAP_CODE_DTYPE)
+            for col, values in arrays.items():
+                with open(files[col], 'ab') as file_buffer:
+                    file_buffer.write(values.tobytes())
+            meta['partitions'].append(os.path.basename(partition['file']))
+            meta['partition_rows'].append(len(partition_df))
+            meta['rows'] += len(partition_df)
+
+        _write_atomic(f'{folder}/{_MMAP_META}', json.dumps(meta).encode())
+        for old_file in glob.glob(f'{folder}/*.bin'):
+            if not old_file.endswith(f'.{meta["token"]}.bin'):
+                os.remove(old_file)
+    return meta
+
+
+def _load_mmap(
+        table: str,
+        db_dir: str = cfg.DB_DIR,
+        columns: Optional[List[str]] = None,
+        manifest: Optional[dict] = None) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """Load meta data and memory-mapped arrays of a table for the partitions in the manifest.
+
+    meta.json is read and the arrays are opened under a shared lock, so a concurrent refresh
+    (see write_mmap) can not replace the arrays in between. Opened arrays stay valid after that.
+    """
+    table = table.lower()
+    if manifest is None:
+        manifest = read_manifest(db_dir)
+    partitions = table_partitions(table, db_dir=db_dir, manifest=manifest)
+    partition_files = [os.path.basename(partition['file']) for partition in partitions]
+    folder = mmap_dir(table, db_dir=db_dir)
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    while True:
+        with locked(f'{folder}/{_MMAP_LOCK}', shared=True):
+            try:
+                meta = read_mmap_meta(table, db_dir=db_dir)
+            except FileNotFoundError:
+                meta = None
+            if _covers(meta, partition_files):
+                return meta, _open_mmap(table, meta, len(partition_files), columns, db_dir)
+        write_mmap(table, db_dir=db_dir, manifest=manifest)
+
+
+def _open_mmap(
+        table: str,
+        meta: dict,
+        partitions: int,
+        columns: Optional[List[str]] = None,
+        db_dir: str = cfg.DB_DIR) -> Dict[str, np.ndarray]:
+    """Open memory-mapped arrays holding the first partitions of a table."""
+    folder = mmap_dir(table, db_dir=db_dir)
+    dtypes = {col: meta['columns'][col] for col in meta['columns']}
+    dtypes.update({col: _MMAP_CODE_DTYPE for col in meta['keys']})
+    if columns is None:
+        columns = list(dtypes.keys())
+    unsupported = [col for col in columns if col not in dtypes]
+    if unsupported:
+        raise ValueError(
+            f'Columns ({unsupported}) are not memory-mapped for table ({table}). '
+            f'Try: {list(dtypes.keys())}.'
+        )
+    rows = sum(meta['partition_rows'][:partitions])
+    if rows == 0:
+        return {col: np.empty(0, dtype=dtypes[col]) for col in columns}
+    return {
+        col: np.memmap(
+            f'{folder}/{col}.{meta["token"]}.bin', dtype=dtypes[col], mode='r', shape=(rows,))
+        for col in columns
+    }
+
+
+def read_mmap(
+        table: str,
+        db_dir: str = cfg.DB_DIR,
+        columns: Optional[List[str]] = None,
+        manifest: Optional[dict] = None) -> Dict[str, np.ndarray]:
+    """Read memory-mapped columns of a table as zero-copy read-only NumPy arrays.
+
+    Partitions missing from the memory-mapped copy are appended first (see write_mmap).
+
+    Args:
+        table: Table name (in MMAP_COLUMNS).
+        db_dir: Database base directory path.
+        columns: Numeric and key columns to read. Reads all memory-mapped columns if None.
+        manifest: Table manifest snapshot (see read_manifest). Read from disk if None.
+
+    Returns:
+        Column name -> array. Numeric columns are float64 values and key columns are int32 codes
+        into the categories listed in the meta data (see read_mmap_meta), -1 for missing values.
+
+    Raises:
+        ValueError: Encountered column that is not memory-mapped for the table.
+    """
+    return _load_mmap(table, db_dir=db_dir, columns=columns, manifest=manifest)[1]
+
+
+def read_mmap_table(
+        table: str,
+        db_dir: str = cfg.DB_DIR,
+        columns: Optional[List[str]] = None,
+        manifest: Optional[dict] = None) -> pd.DataFrame:
+    """Read memory-mapped columns of a table to pandas DataFrame.
+
+    Numeric columns are backed by the memory-mapped arrays and key columns are returned as
+    ordered categoricals built from the int codes (categories are sorted, so e.g. the latest date
+    is the max of the date column).
+
+    Args:
+        table: Table name (in MMAP_COLUMNS).
+        db_dir: Database base directory path.
+        columns: Numeric and key columns to read. Reads all memory-mapped columns if None.
+        manifest: Table manifest snapshot (see read_manifest). Read from disk if None.
+
+    Returns:
+        pandas DataFrame containing table data
+
+    Raises:
+        ValueError: Encountered column that is not memory-mapped for the table.
+    """
+    meta, arrays = _load_mmap(table, db_dir=db_dir, columns=columns, manifest=manifest)
+    table_data = {}
+    for col, values in arrays.items():
+        if col in meta['keys']:
+            categories = meta['keys'][col]
+            values = pd.Categorical.from_codes(values, categories=categories)
+            values = values.reorder_categories(pd.Index(categories).sort_values(), ordered=True)
+        table_data[col] = values
+    return pd.DataFrame(table_data, copy=False)
+
+
 # -----------------------------------------------------------------------------
 # -- Table file read methods
 # -----------------------------------------------------------------------------
+# Identifier columns are always read as strings. Inferring their type per file would turn account
+# numbers like 0012345 into 12345 and give the same column different types in different partitions.
+KEY_COLUMNS = sorted({col for keys in MMAP_KEYS.values() for col in keys})
+_KEY_DTYPES = {col: str for col in KEY_COLUMNS}
 
 
-def read_transactions(db_dir: str = cfg.DB_DIR) -> pd.DataFrame:
+def read_header(file_name: str) -> List[str]:
+    """Read the column names of a table file (including the index column).
+
+    Args:
+        file_name: Table file path.
+
+    Returns:
+        List of column names.
+    """
+    return list(pd.read_csv(file_name, nrows=0).columns)
+
+
+def read_table(file_name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read table file to pandas DataFrame, optionally projected to a subset of columns.
+
+    The first column of the file is always used as the index. Requested columns that are missing
+    from the file (e.g. institution specific transaction columns) are returned as empty columns so
+    that projections are stable regardless of which institutions wrote the table. KEY_COLUMNS are
+    read as strings.
+
+    Args:
+        file_name: Table file path.
+        columns: Columns to read. Reads all columns if None.
+
+    Returns:
+        pandas DataFrame containing table data
+    """
+    if columns is None:
+        return pd.read_csv(file_name, index_col=0, dtype=_KEY_DTYPES)
+    header = read_header(file_name)
+    index_col = header[0]
+    columns = [col for col in columns if col != index_col]
+    usecols = [index_col] + [col for col in columns if col in header]
+    table_df = pd.read_csv(file_name, usecols=usecols, index_col=index_col, dtype=_KEY_DTYPES)
+    return table_df.reindex(columns=columns)
+
+
+def read_partitions(
+        partitions: List[dict], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read table partitions to a single pandas DataFrame.
+
+    Partitions may have different columns (e.g. written for different institutions). Their
+    schemas are unioned at read time: columns missing from a partition are returned as empty.
+
+    Args:
+        partitions: Partition dicts (see table_partitions).
+        columns: Columns to read. Reads the union of all partition columns if None.
+
+    Returns:
+        pandas DataFrame containing table data
+    """
+    frames = [read_table(partition['file'], columns=columns) for partition in partitions]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, sort=False)
+
+
+def read_db_table(
+        table: str,
+        db_dir: str = cfg.DB_DIR,
+        columns: Optional[List[str]] = None,
+        manifest: Optional[dict] = None) -> pd.DataFrame:
+    """Read all partitions of a database table to pandas DataFrame.
+
+    Args:
+        table: Table name (in TABLES).
+        db_dir: Database base directory path.
+        columns: Columns to read. Reads all columns if None.
+        manifest: Table manifest snapshot (see read_manifest). Read from disk if None.
+
+    Returns:
+        pandas DataFrame containing table data
+    """
+    partitions = table_partitions(table, db_dir=db_dir, manifest=manifest)
+    return read_partitions(partitions, columns=columns)
+
+
+def read_transactions(
+        db_dir: str = cfg.DB_DIR,
+        columns: Optional[List[str]] = None,
+        mmap: bool = False) -> pd.DataFrame:
     """Read transactions to pandas DataFrame.
 
     Args:
         db_dir: Database base directory path.
+        columns: Columns to read. Reads all columns if None.
+        mmap: Read the memory-mapped numeric and key columns instead of the csv file (see
+              read_mmap_table).
 
     Returns:
         pandas DataFrame containing transactions data
     """
-    file_name = table_file('transactions', db_dir=db_dir)
-    return pd.read_csv(file_name, index_col=0)
+    if mmap:
+        return read_mmap_table('transactions', db_dir=db_dir, columns=columns)
+    return read_db_table('transactions', db_dir=db_dir, columns=columns)
 
 
-def read_balances(db_dir: str = cfg.DB_DIR) -> pd.DataFrame:
+def read_balances(
+        db_dir: str = cfg.DB_DIR, columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Read balances to pandas DataFrame.
 
     Args:
         db_dir: Database base directory path.
+        columns: Columns to read. Reads all columns if None.
 
     Returns:
         pandas DataFrame containing balance data
     """
-    file_name = table_file('balances', db_dir=db_dir)
-    return pd.read_csv(file_name, index_col=0)
+    return read_db_table('balances', db_dir=db_dir, columns=columns)
 
 
-def read_securities(db_dir: str = cfg.DB_DIR) -> pd.DataFrame:
+def read_securities(
+        db_dir: str = cfg.DB_DIR, columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Read securities to pandas DataFrame.
 
     Args:
         db_dir: Database base directory path.
+        columns: Columns to read. Reads all columns if None.
 
     Returns:
         pandas DataFrame containing securities data
     """
-    file_name = table_file('securities', db_dir=db_dir)
-    return pd.read_csv(file_name, index_col=0)
+    return read_db_table('securities', db_dir=db_dir, columns=columns)
 
 
-def read_acct_info(db_dir: str = cfg.DB_DIR) -> pd.DataFrame:
+def read_acct_info(
+        db_dir: str = cfg.DB_DIR, columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Read account info to pandas DataFrame.
 
     Args:
         db_dir: Database base directory path.
+        columns: Columns to read. Reads all columns if None.
 
     Returns:
         pandas DataFrame containing account info data
     """
-    file_name = table_file('acct_info', db_dir=db_dir)
-    return pd.read_csv(file_name, index_col=0)
+    return read_db_table('acct_info', db_dir=db_dir, columns=columns)
 
 
-def read_positions(db_dir: str = cfg.DB_DIR) -> pd.DataFrame:
+def read_positions(
+        db_dir: str = cfg.DB_DIR,
+        columns: Optional[List[str]] = None,
+        mmap: bool = False) -> pd.DataFrame:
     """Read positions to pandas DataFrame.
 
     Args:
         db_dir: Database base directory path.
+        columns: Columns to read. Reads all columns if None.
+        mmap: Read the memory-mapped numeric and key columns instead of the csv file (see
+              read_mmap_table).
 
     Returns:
         pandas DataFrame containing positions data
     """
-    file_name = table_file('positions', db_dir=db_dir)
-    return pd.read_csv(file_name, index_col=0)
+    if mmap:
+        return read_mmap_table('positions', db_dir=db_dir, columns=columns)
+    return read_db_table('positions', db_dir=db_dir, columns=columns)
 
 
-def read_exposures() -> pd.DataFrame:
+def read_exposures(columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Read exposures to pandas DataFrame.
 
+    Args:
+        columns: Columns to read. Reads all columns if None.
+
     Returns:
         pandas DataFrame containing exposure data
     """
     file_name = aux_table_file('exposures')
-    return pd.read_csv(file_name, index_col=0)
+    return read_table(file_name, columns=columns)
+
+
+def read_fund_holdings(columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read fund holdings to pandas DataFrame.
+
+    Args:
+        columns: Columns to read. Reads all columns if None.
+
+    Returns:
+        pandas DataFrame containing fund holdings data
+    """
+    file_name = aux_table_file('fund_holdings')
+    return read_table(file_name, columns=columns)
 
 
 if __name__ == '__main__':
+    print(list_tenants())
+
     for t in list(TABLES.keys()):
-        print(table_file(table=t))
+        print(t, [p['file'] for p in table_partitions(table=t)])
 
     for t in list(AUX_TABLES.keys()):
         print(aux_table_file(table=t))
@@ -165,6 +834,7 @@ if __name__ == '__main__':
         read_acct_info,
         read_balances,
         read_exposures,
+        read_fund_holdings,
         read_positions,
         read_securities,
         read_transactions,
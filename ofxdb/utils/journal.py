@@ -0,0 +1,415 @@
+#!python
+"""Aggregation run journal module.
+
+Makes aggregation runs transactional. Each run writes its records as new, immutable table
+partitions (e.g. positions.<run_id>.0.csv) which are committed together by atomically replacing
+the table manifest (see file_util.read_manifest), so a crash or parse error mid-run leaves the
+committed tables untouched and the run can simply be retried.
+
+The manifest records the columns of every partition, so columns that are new to a table are
+handled as metadata: only the new partition is wider and readers union the partition schemas at
+read time. It also keeps a journal of the last KEEP_RUNS committed runs. Tables are append-only,
+so rolling back a run only truncates the partition lists in the manifest; no table data is copied.
+Committed partitions are never modified, and partitions dropped by a rollback or compaction are
+only deleted by the commit after it, so readers that read the manifest once keep a consistent
+snapshot while new runs are committed.
+"""
+import os
+import re
+import json
+import shutil
+import argparse
+import datetime
+from typing import Dict, List, Optional, Set
+
+from ofxdb.utils import file_util
+from ofxdb import cfg
+
+# -----------------------------------------------------------------------------
+# -- Manifest write methods
+# -----------------------------------------------------------------------------
+KEEP_RUNS = 5
+_LOCK_FILE = '.lock'
+_RUN_ID_FORMAT = '%Y%m%d-%H%M%S-%f'
+_VERSIONED_FILE = re.compile(r'^.+\.\d{8}-\d{6}-\d{6}(\..+)?$')
+
+
+def _fsync(file_name: str) -> None:
+    """Flush file (or directory entries) to disk."""
+    file_descriptor = os.open(file_name, os.O_RDONLY)
+    try:
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+
+
+def write_manifest(manifest: dict, db_dir: str = cfg.DB_DIR) -> None:
+    """Atomically replace the table manifest.
+
+    Args:
+        manifest: Manifest dict (tables, history).
+        db_dir: Database base directory path.
+
+    Returns:
+        None
+    """
+    base_path = file_util.tables_dir(db_dir)
+    manifest_file = f'{base_path}/{file_util.MANIFEST}'
+    tmp_name = f'{manifest_file}.{os.getpid()}.tmp'
+    with open(tmp_name, 'w') as file_buffer:
+        json.dump(manifest, file_buffer, indent=2)
+        file_buffer.flush()
+        os.fsync(file_buffer.fileno())
+    os.replace(tmp_name, manifest_file)
+    _fsync(base_path)
+
+
+def referenced_files(manifest: dict) -> Set[str]:
+    """Get table files referenced by the manifest.
+
+    Args:
+        manifest: Manifest dict (tables, history).
+
+    Returns:
+        Set of table file names.
+    """
+    files = set()
+    for entry in manifest['tables'].values():
+        if isinstance(entry, str):
+            files.add(entry)
+        else:
+            files.update(partition['file'] for partition in entry['partitions'])
+    return files
+
+
+def retired_files(previous: dict, manifest: dict) -> List[str]:
+    """Get table files referenced by the previous manifest but not by the new one.
+
+    Args:
+        previous: Manifest dict being replaced.
+        manifest: New manifest dict.
+
+    Returns:
+        Sorted list of table file names.
+    """
+    return sorted(referenced_files(previous) - referenced_files(manifest))
+
+
+def collect_garbage(manifest: dict, db_dir: str = cfg.DB_DIR) -> None:
+    """Remove table partitions that are not referenced by the manifest.
+
+    Removes partitions staged by runs that were never committed (e.g. crashed runs) or that were
+    rolled back or compacted. Partitions retired by the manifest (referenced by the manifest it
+    replaced) are kept until the next commit, for readers of the previous manifest. Files without a
+    run id (e.g. tables written before the journal existed) are kept.
+
+    Must only be called while holding the journal lock (see Transaction).
+
+    Args:
+        manifest: Manifest dict (tables, history).
+        db_dir: Database base directory path.
+
+    Returns:
+        None
+    """
+    base_path = file_util.tables_dir(db_dir)
+    referenced = referenced_files(manifest) | set(manifest.get('retired', []))
+    for file_name in os.listdir(base_path):
+        if _VERSIONED_FILE.match(file_name) is None or file_name in referenced:
+            continue
+        path = f'{base_path}/{file_name}'
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+def table_entry(manifest: dict, table: str, db_dir: str = cfg.DB_DIR) -> dict:
+    """Get the manifest entry of a table.
+
+    Tables written before the manifest tracked partitions are converted to a single partition
+    whose columns are read from the file header.
+
+    Args:
+        manifest: Manifest dict (tables, history).
+        table: Table name (in file_util.TABLES).
+        db_dir: Database base directory path.
+
+    Returns:
+        Table entry dict (partitions, columns, evolution).
+    """
+    entry = manifest['tables'].get(file_util.TABLES[table.lower()])
+    if isinstance(entry, dict):
+        return {
+            'partitions': list(entry['partitions']),
+            'columns': list(entry['columns']),
+            'evolution': list(entry.get('evolution', [])),
+        }
+    partitions = []
+    columns: List[str] = []
+    for partition in file_util.table_partitions(table, db_dir=db_dir, manifest=manifest):
+        columns = file_util.read_header(partition['file'])
+        partitions.append({
+            'file': os.path.basename(partition['file']), 'columns': columns, 'rows': None
+        })
+    return {'partitions': partitions, 'columns': columns, 'evolution': []}
+
+
+# -----------------------------------------------------------------------------
+# -- Aggregation run transaction
+# -----------------------------------------------------------------------------
+
+
+class Transaction:
+    """Aggregation run transaction.
+
+    Used as a context manager: staged partitions are committed if the block completes and
+    discarded if it raises. Runs are serialized with an exclusive lock on the tables folder.
+
+    Example:
+        with journal.Transaction(db_dir) as txn:
+            new_df.to_csv(txn.stage_partition('positions', columns, len(new_df)))
+    """
+    def __init__(self, db_dir: str = cfg.DB_DIR):
+        self.db_dir = db_dir
+        self.run_id = datetime.datetime.now(cfg.OFX_TIMEZONE).strftime(_RUN_ID_FORMAT)
+        self.manifest: Optional[dict] = None
+        self.staged: Dict[str, List[dict]] = {}
+        self.replaced: Set[str] = set()
+        self._lock = None
+
+    def __enter__(self) -> 'Transaction':
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def begin(self) -> None:
+        """Acquire the journal lock, snapshot the manifest and clean up after crashed runs."""
+        base_path = file_util.tables_dir(self.db_dir)
+        self._lock = open(f'{base_path}/{_LOCK_FILE}', 'a')
+        file_util.lock_file(self._lock)
+        self.manifest = file_util.read_manifest(self.db_dir)
+        collect_garbage(self.manifest, db_dir=self.db_dir)
+
+    def stage_partition(
+            self,
+            table: str,
+            columns: List[str],
+            rows: int,
+            replace: bool = False) -> str:
+        """Retrieve full path to write a new partition of a table to.
+
+        Args:
+            table: Table name (in file_util.TABLES).
+            columns: Columns of the partition, including the index column.
+            rows: Number of rows in the partition.
+            replace: Replace all committed partitions of the table (see compact).
+
+        Returns:
+            A string representing full path of the staged partition.
+        """
+        base_file = file_util.table_file(table, db_dir=self.db_dir)
+        file_name = os.path.basename(base_file)
+        stem, extension = os.path.splitext(file_name)
+        staged = self.staged.setdefault(file_name, [])
+        partition = f'{stem}.{self.run_id}.{len(staged)}{extension}'
+        staged.append({'file': partition, 'columns': list(columns), 'rows': rows})
+        if replace:
+            self.replaced.add(file_name)
+        return f'{os.path.dirname(base_file)}/{partition}'
+
+    def commit(self) -> None:
+        """Commit all staged partitions by atomically replacing the manifest."""
+        base_path = file_util.tables_dir(self.db_dir)
+        try:
+            if not self.staged:
+                return
+            tables = dict(self.manifest['tables'])
+            for file_name, partitions in self.staged.items():
+                for partition in partitions:
+                    _fsync(f'{base_path}/{partition["file"]}')
+                table = next(key for key, value in file_util.TABLES.items() if value == file_name)
+                entry = table_entry(self.manifest, table, db_dir=self.db_dir)
+                if file_name in self.replaced:
+                    entry = {'partitions': [], 'columns': [], 'evolution': entry['evolution']}
+                new_columns = []
+                for partition in partitions:
+                    new_columns += [
+                        col for col in partition['columns']
+                        if col not in entry['columns'] and col not in new_columns
+                    ]
+                if new_columns and entry['partitions']:
+                    entry['evolution'].append({'run_id': self.run_id, 'columns': new_columns})
+                entry['columns'] += new_columns
+                entry['partitions'] += partitions
+                tables[file_name] = entry
+
+            run = {
+                'run_id': self.run_id,
+                'datetime': datetime.datetime.now(cfg.OFX_TIMEZONE).isoformat(),
+                'updated': sorted(self.staged.keys()),
+            }
+            if self.replaced:
+                # Rewritten partitions can not be truncated: the run is a rollback barrier.
+                run['compacted'] = True
+            else:
+                run['added'] = {
+                    file_name: len(partitions) for file_name, partitions in self.staged.items()
+                }
+            history = self.manifest['history'] + [run]
+            manifest = {
+                'run_id': self.run_id,
+                'tables': tables,
+                'history': history[-KEEP_RUNS:],
+                'compacted': bool(self.replaced) or self.manifest.get('compacted', False),
+            }
+            manifest['retired'] = retired_files(self.manifest, manifest)
+            self.manifest = manifest
+            write_manifest(self.manifest, db_dir=self.db_dir)
+            collect_garbage(self.manifest, db_dir=self.db_dir)
+        finally:
+            self._release()
+
+    def abort(self) -> None:
+        """Discard all staged partitions."""
+        try:
+            collect_garbage(self.manifest, db_dir=self.db_dir)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """Release the journal lock."""
+        if self._lock is not None:
+            file_util.unlock_file(self._lock)
+            self._lock.close()
+            self._lock = None
+
+
+# -----------------------------------------------------------------------------
+# -- Compaction method
+# -----------------------------------------------------------------------------
+
+
+def compact(tables: Optional[List[str]] = None, db_dir: str = cfg.DB_DIR) -> None:
+    """Rewrite all partitions of each table into a single partition.
+
+    This is the only operation that rewrites table history. It is never run implicitly; use it
+    when a table has accumulated many small partitions. The compaction is journaled as a rollback
+    barrier: neither it nor the runs committed before it can be rolled back.
+
+    Args:
+        tables: Table names (in file_util.TABLES). Defaults to all tables.
+        db_dir: Database base directory path.
+
+    Returns:
+        None
+    """
+    if tables is None:
+        tables = list(dict((value, key) for key, value in file_util.TABLES.items()).values())
+    with Transaction(db_dir) as txn:
+        for table in tables:
+            partitions = file_util.table_partitions(table, db_dir=db_dir, manifest=txn.manifest)
+            if len(partitions) < 2:
+                continue
+            table_df = file_util.read_partitions(partitions)
+            columns = [table_df.index.name] + list(table_df.columns)
+            table_df.to_csv(txn.stage_partition(table, columns, len(table_df), replace=True))
+
+
+# -----------------------------------------------------------------------------
+# -- Rollback method
+# -----------------------------------------------------------------------------
+
+
+def rollback(run_id: Optional[str] = None, db_dir: str = cfg.DB_DIR) -> dict:
+    """Roll back a committed run and every run committed after it.
+
+    Only runs committed after the last rollback barrier can be rolled back. Barriers are runs that
+    did not only append partitions: compactions and runs journaled before tables were
+    partitioned.
+
+    Args:
+        run_id: Run to roll back. Defaults to the last committed run.
+        db_dir: Database base directory path.
+
+    Returns:
+        The new manifest.
+
+    Raises:
+        ValueError: Run is not in the journal or is not after the last rollback barrier.
+    """
+    txn = Transaction(db_dir)
+    txn.begin()
+    try:
+        manifest = txn.manifest
+        history_ids = [run['run_id'] for run in manifest['history']]
+        barriers = [index for index, run in enumerate(manifest['history']) if 'added' not in run]
+        first = barriers[-1] + 1 if barriers else 0
+        run_ids = history_ids[first:]
+        if run_id is None and run_ids:
+            run_id = run_ids[-1]
+        if run_id not in run_ids:
+            raise ValueError(f'Run ({run_id}) can not be rolled back. Try: {run_ids}.')
+        index = history_ids.index(run_id)
+
+        tables = dict(manifest['tables'])
+        for run in manifest['history'][index:]:
+            for file_name, added in run['added'].items():
+                entry = dict(tables[file_name])
+                removed = [
+                    col for change in entry.get('evolution', [])
+                    if change['run_id'] == run['run_id'] for col in change['columns']
+                ]
+                entry['partitions'] = entry['partitions'][:len(entry['partitions']) - added]
+                entry['columns'] = [col for col in entry['columns'] if col not in removed]
+                entry['evolution'] = [
+                    change for change in entry.get('evolution', [])
+                    if change['run_id'] != run['run_id']
+                ]
+                if entry['partitions']:
+                    tables[file_name] = entry
+                else:
+                    del tables[file_name]
+        history = manifest['history'][:index]
+        previous = manifest
+        manifest = {
+            'run_id': history[-1]['run_id'] if history else None,
+            'tables': tables,
+            'history': history,
+            'compacted': manifest.get('compacted', False),
+        }
+        manifest['retired'] = retired_files(previous, manifest)
+        write_manifest(manifest, db_dir=db_dir)
+        txn.manifest = manifest
+    finally:
+        txn.abort()
+    return manifest
+
+
+if __name__ == '__main__':
+    description = 'Show or roll back committed aggregation runs.'
+    arg_parser = argparse.ArgumentParser(description=description)
+    arg_parser.add_argument(
+        '--compact',
+        dest='compact',
+        action='store_const',
+        const=True,
+        default=False,
+        help='Rewrite all partitions of each table into a single partition.')
+    arg_parser.add_argument(
+        '-rollback', type=str, default=None, nargs='?', const='',
+        help='Roll back the given run (and every later run). Defaults to the last run.')
+    args = arg_parser.parse_args()
+
+    if args.rollback is not None:
+        rollback(run_id=args.rollback or None)
+    if args.compact:
+        compact()
+    for journal_run in file_util.read_manifest()['history']:
+        print(journal_run['run_id'], journal_run['datetime'], ', '.join(journal_run['updated']))
@@ -1,50 +1,543 @@
 #!python
+"""View module.
+
+Views are registered together with the tables (and table columns) they need. Requested views are
+run as a batch: each table is loaded once, projected to the union of the columns needed by all
+requested views, shared intermediate results are computed once, and independent views are run
+concurrently.
+
+Views can also be run across tenants (see ofxdb.data.tenants): only the shards of the requested
+tenants are read, and their tables are concatenated with a tenant column, so views aggregate the
+selected tenants together and cross-tenant views break results down by tenant.
+"""
+import os
 import argparse
-from typing import Union
+import warnings
+import concurrent.futures
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Union
 
 import numpy as np
 import pandas as pd
 
 from ofxdb.utils import file_util
-from ofxdb.data import extarct, agg
+from ofxdb.data import extarct, agg, rollup, tenants
+from ofxdb import cfg, exposure
 
+# -----------------------------------------------------------------------------
+# -- View registry
+# -----------------------------------------------------------------------------
+
+
+class View(NamedTuple):
+    """Registered view.
+
+    Attributes:
+        func: View function. Takes a ViewContext and returns a pandas DataFrame.
+        tables: Table name -> list of columns read by the view function (None for all columns).
+        intermediates: Names of shared intermediate results used by the view function.
+        transpose: Show the view transposed (one column per index value) in markdown output.
+        cross_tenant: View breaks results down by tenant and can only be run across tenants.
+    """
+    func: Callable
+    tables: Dict[str, Optional[List[str]]]
+    intermediates: List[str]
+    transpose: bool
+    cross_tenant: bool
+
+
+class Intermediate(NamedTuple):
+    """Registered intermediate result shared between views.
+
+    Attributes:
+        func: Intermediate function. Takes a ViewContext and returns a pandas DataFrame.
+        tables: Table name -> list of columns read by the intermediate function (None for all
+                columns).
+        intermediates: Names of intermediate results the intermediate function builds on.
+    """
+    func: Callable
+    tables: Dict[str, Optional[List[str]]]
+    intermediates: List[str]
+
+
+VIEWS: Dict[str, View] = {}
+INTERMEDIATES: Dict[str, Intermediate] = {}
 
-def risk(acctid: Union[list, None] = None) -> pd.DataFrame:
-    """Compute risk of aggregate portfolio.
+
+def register_view(
+        name: str,
+        tables: Optional[Dict[str, Optional[List[str]]]] = None,
+        intermediates: Optional[List[str]] = None,
+        transpose: bool = False,
+        cross_tenant: bool = False) -> Callable:
+    """Decorator used to register a view function.
 
     Args:
-        acctid: Account IDs
+        name: View name (used on the command line).
+        tables: Table name -> list of columns read by the view function (None for all columns).
+        intermediates: Names of shared intermediate results used by the view function.
+        transpose: Show the view transposed in markdown output.
+        cross_tenant: View can only be run across tenants (tables have a tenant column).
 
     Returns:
-        pandas DataFrame with portfolio risk statistics.
+        Decorator that registers the view function and returns it unchanged.
+    """
+    def decorator(func: Callable) -> Callable:
+        VIEWS[name] = View(func, tables or {}, intermediates or [], transpose, cross_tenant)
+        return func
+    return decorator
+
+
+def register_intermediate(
+        name: str,
+        tables: Optional[Dict[str, Optional[List[str]]]] = None,
+        intermediates: Optional[List[str]] = None) -> Callable:
+    """Decorator used to register an intermediate result shared between views.
+
+    Args:
+        name: Intermediate name.
+        tables: Table name -> list of columns read by the intermediate function (None for all
+                columns).
+        intermediates: Names of intermediate results the intermediate function builds on.
+
+    Returns:
+        Decorator that registers the intermediate function and returns it unchanged.
+    """
+    def decorator(func: Callable) -> Callable:
+        INTERMEDIATES[name] = Intermediate(func, tables or {}, intermediates or [])
+        return func
+    return decorator
+
+
+# -----------------------------------------------------------------------------
+# -- View execution planner
+# -----------------------------------------------------------------------------
+
+
+class ViewContext:
+    """Tables and intermediate results available to views during a batch run.
+
+    Tables and intermediates are shared between concurrently running views and must be treated as
+    read-only.
+    """
+    def __init__(self, tables: Dict[str, pd.DataFrame], acctid: Union[list, None] = None):
+        self.tables = tables
+        self.acctid = acctid
+        self.intermediates: Dict[str, pd.DataFrame] = {}
+
+    def table(self, table: str) -> pd.DataFrame:
+        """Retrieve a loaded table."""
+        return self.tables[table]
+
+    def intermediate(self, name: str) -> pd.DataFrame:
+        """Retrieve a computed intermediate result."""
+        return self.intermediates[name]
+
+
+def resolve_intermediates(views: Sequence[str]) -> List[str]:
+    """Resolve the intermediate results needed by a batch of views.
+
+    Args:
+        views: View names.
+
+    Returns:
+        Intermediate names, each listed after the intermediates it builds on.
+
+    Raises:
+        ValueError: Encountered view that was not registered (in VIEWS).
+    """
+    resolved: List[str] = []
+
+    def visit(name: str) -> None:
+        if name not in resolved:
+            for dependency in INTERMEDIATES[name].intermediates:
+                visit(dependency)
+            resolved.append(name)
+
+    for view in views:
+        if view not in VIEWS:
+            raise ValueError(f'View ({view}) not supported. Try: {list(VIEWS.keys())}.')
+        for name in VIEWS[view].intermediates:
+            visit(name)
+    return resolved
+
+
+def plan(views: Sequence[str]) -> Dict[str, Optional[List[str]]]:
+    """Plan the table reads needed to run a batch of views.
+
+    Args:
+        views: View names.
+
+    Returns:
+        Table name -> union of the columns needed by the views and their intermediates (None if
+        all columns are needed).
+
+    Raises:
+        ValueError: Encountered view that was not registered (in VIEWS).
+    """
+    requirements = [INTERMEDIATES[name].tables for name in resolve_intermediates(views)]
+    requirements += [VIEWS[view].tables for view in views]
+    table_plan: Dict[str, Optional[List[str]]] = {}
+    for tables in requirements:
+        for table, columns in tables.items():
+            if table in table_plan and table_plan[table] is None:
+                continue
+            if columns is None:
+                table_plan[table] = None
+                continue
+            table_columns = table_plan.setdefault(table, [])
+            table_columns += [col for col in columns if col not in table_columns]
+    return table_plan
+
+
+def read_view_table(
+        table: str,
+        columns: Optional[List[str]] = None,
+        db_dir: str = cfg.DB_DIR,
+        mmap: bool = False,
+        manifest: Optional[dict] = None) -> pd.DataFrame:
+    """Read a database or aux table projected to the given columns.
+
+    Args:
+        table: Table name.
+        columns: Columns to read. Reads all columns if None.
+        db_dir: Database base directory path.
+        mmap: Read the memory-mapped copy of the table when it holds all the requested columns.
+        manifest: Table manifest snapshot (see file_util.read_manifest). Read from disk if None.
+
+    Returns:
+        pandas DataFrame containing table data
+    """
+    mmap_columns = file_util.MMAP_COLUMNS.get(table, []) + file_util.MMAP_KEYS.get(table, [])
+    if mmap and columns is not None and mmap_columns and set(columns) <= set(mmap_columns):
+        return file_util.read_mmap_table(
+            table, db_dir=db_dir, columns=columns, manifest=manifest)
+    if table in file_util.AUX_TABLES:
+        return file_util.read_table(file_util.aux_table_file(table), columns=columns)
+    return file_util.read_db_table(table, db_dir=db_dir, columns=columns, manifest=manifest)
+
+
+TENANT_COL = 'tenant'
+
+
+def load_tables(
+        table_plan: Dict[str, Optional[List[str]]],
+        db_dir: str = cfg.DB_DIR,
+        max_workers: Optional[int] = None,
+        mmap: bool = False,
+        tenant_names: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Load each planned table once, concurrently.
+
+    All tables are read from the same manifest snapshot, so a run committed while loading is not
+    mixed in.
+
+    When tenants are given, each database table is read from the shard of every tenant (and no
+    other shard) and the shards are concatenated with a tenant column. Aux tables are read once.
+
+    Args:
+        table_plan: Table name -> columns to read (see plan).
+        db_dir: Database base directory path.
+        max_workers: Maximum number of concurrent reads.
+        mmap: Read memory-mapped table copies where possible (see read_view_table).
+        tenant_names: Tenant names. Reads the database directory itself if None.
+
+    Returns:
+        Table name -> pandas DataFrame.
+    """
+    if tenant_names is None:
+        shard_dirs = {None: db_dir}
+    else:
+        shard_dirs = {
+            tenant: file_util.tenant_dir(tenant, db_dir=db_dir) for tenant in tenant_names
+        }
+    manifests = {tenant: file_util.read_manifest(shard) for tenant, shard in shard_dirs.items()}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for table, columns in table_plan.items():
+            if table in file_util.AUX_TABLES:
+                futures[table] = {
+                    None: executor.submit(read_view_table, table, columns, db_dir, mmap)
+                }
+                continue
+            futures[table] = {
+                tenant: executor.submit(
+                    read_view_table, table, columns, shard, mmap, manifests[tenant])
+                for tenant, shard in shard_dirs.items()
+            }
+        shards = {
+            table: {tenant: future.result() for tenant, future in table_futures.items()}
+            for table, table_futures in futures.items()
+        }
+
+    tables = {}
+    for table, table_shards in shards.items():
+        if None in table_shards:
+            tables[table] = table_shards[None]
+            continue
+        table_df = pd.concat(table_shards, names=[TENANT_COL], sort=False)
+        table_df = table_df.reset_index(level=TENANT_COL)
+        table_df[TENANT_COL] = table_df[TENANT_COL].astype('category')
+        tables[table] = table_df
+    return tables
+
+
+def run_views(
+        views: Sequence[str],
+        acctid: Union[list, None] = None,
+        db_dir: str = cfg.DB_DIR,
+        max_workers: Optional[int] = None,
+        mmap: bool = False,
+        tenant_names: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Run a batch of views.
+
+    1) Plan the table reads for all views.
+    2) Load each table once.
+    3) Compute each shared intermediate result once.
+    4) Run the views concurrently.
+
+    Args:
+        views: View names.
+        acctid: Account IDs. All accounts are used if None.
+        db_dir: Database base directory path.
+        max_workers: Maximum number of concurrent table reads and views.
+        mmap: Read memory-mapped table copies where possible (see read_view_table).
+        tenant_names: Tenant names to run the views across (see load_tables). Runs the views on
+                      the database directory itself if None.
+
+    Returns:
+        View name -> pandas DataFrame, in the order requested.
+
+    Raises:
+        ValueError: Encountered unknown tenant, or cross-tenant view without tenants.
+
+    Warns:
+        UserWarning: Rollup tables read by the views have not been built yet (see
+                     rollup.rebuild_rollups), so those views are incomplete.
+    """
+    views = list(dict.fromkeys(views))
+    table_plan = plan(views)
+    if tenant_names is None:
+        cross_tenant = [view for view in views if VIEWS[view].cross_tenant]
+        if cross_tenant:
+            raise ValueError(f'Views ({cross_tenant}) can only be run across tenants.')
+    else:
+        unknown = sorted(set(tenant_names) - set(file_util.list_tenants(db_dir)))
+        if unknown:
+            raise ValueError(
+                f'Tenants ({unknown}) not found. Try: {file_util.list_tenants(db_dir)}.')
+    shard_dirs = {None: db_dir} if tenant_names is None else {
+        tenant: file_util.tenant_dir(tenant, db_dir=db_dir) for tenant in tenant_names
+    }
+    for tenant, shard_dir in shard_dirs.items():
+        missing = rollup.missing_rollups(list(table_plan), db_dir=shard_dir)
+        if missing:
+            tenant_arg = '' if tenant is None else f' -tenant {tenant}'
+            warnings.warn(
+                f'Rollup tables ({missing}) have not been built at: {shard_dir}. Views reading '
+                f'them are incomplete until the next aggregation run. '
+                f'Try: python ofxdb/data/rollup.py --rebuild{tenant_arg}.')
+    tables = load_tables(
+        table_plan, db_dir=db_dir, max_workers=max_workers, mmap=mmap, tenant_names=tenant_names)
+    context = ViewContext(tables, acctid=acctid)
+    for name in resolve_intermediates(views):
+        context.intermediates[name] = INTERMEDIATES[name].func(context)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {view: executor.submit(VIEWS[view].func, context) for view in views}
+        return {view: future.result() for view, future in futures.items()}
+
+
+# -----------------------------------------------------------------------------
+# -- View output methods
+# -----------------------------------------------------------------------------
+OUTPUT_FORMATS = {
+    'markdown': 'md',
+    'csv': 'csv',
+    'json': 'json',
+    'parquet': 'parquet',
+}
+
+
+def format_view(view: str, view_df: pd.DataFrame, output_format: str = 'markdown') -> str:
+    """Format view as text.
+
+    Args:
+        view: View name.
+        view_df: View DataFrame.
+        output_format: One of markdown, csv or json.
+
+    Returns:
+        View formatted as a string.
+
+    Raises:
+        ValueError: Encountered format that can not be represented as text.
+    """
+    if output_format == 'markdown':
+        if VIEWS[view].transpose:
+            headers = [view_df.index.name] + list(view_df.index)
+            return view_df.T.to_markdown(
+                headers=headers, tablefmt='fancy_grid', numalign='right', floatfmt=',.2f')
+        return view_df.to_markdown(
+            headers='keys', tablefmt='fancy_grid', numalign='right', floatfmt=',.2f')
+    if output_format == 'csv':
+        return view_df.to_csv()
+    if output_format == 'json':
+        return view_df.reset_index().to_json(orient='records', date_format='iso')
+    raise ValueError(
+        f'Format ({output_format}) can not be shown as text. Try: markdown, csv or json.')
+
+
+def write_view(
+        view: str,
+        view_df: pd.DataFrame,
+        output_format: str = 'markdown',
+        output_dir: str = '.') -> str:
+    """Write view to disk.
+
+    Args:
+        view: View name.
+        view_df: View DataFrame.
+        output_format: One of OUTPUT_FORMATS.
+        output_dir: Destination directory.
+
+    Returns:
+        Full path of the written file.
+
+    Raises:
+        ValueError: Encountered format that was not supported (in OUTPUT_FORMATS).
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f'Format ({output_format}) not supported. Try: {list(OUTPUT_FORMATS.keys())}.')
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    file_name = f'{output_dir}/{view}.{OUTPUT_FORMATS[output_format]}'
+    if output_format == 'parquet':
+        # Requires one of the pandas parquet engines (pyarrow or fastparquet) to be installed.
+        view_df.to_parquet(file_name)
+    else:
+        with open(file_name, 'w') as file_buffer:
+            file_buffer.write(format_view(view, view_df, output_format))
+    return file_name
+
+
+# -----------------------------------------------------------------------------
+# -- Intermediate results
+# -----------------------------------------------------------------------------
+_POSITION_KEYS = ['date', 'acctid', 'uniqueid', 'uniqueidtype']
+
+
+@register_intermediate(
+    'portfolio_history',
+    tables={
+        'positions': _POSITION_KEYS + ['mktval', 'units'],
+        'securities': ['date', 'uniqueid', 'uniqueidtype', 'ticker'],
+    })
+def portfolio_history(context: ViewContext) -> pd.DataFrame:
+    """Deduplicated positions for all dates, with tickers.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with market value and units by date, account and security.
     """
-    exposures = file_util.read_exposures()
-    positions = file_util.read_positions()
-    securities = file_util.read_securities()
+    positions = context.table('positions')
+    securities = context.table('securities')
 
     securities = securities.drop_duplicates(['ticker', 'date'], keep='last')
     securities = securities[['date', 'uniqueid', 'uniqueidtype', 'ticker']]
 
-    if acctid is not None:
-        positions = positions[positions['acctid'].isin(acctid)]
-    positions = positions.drop_duplicates(
-        subset=['date', 'acctid', 'uniqueid', 'uniqueidtype'], keep='last')
-    portfolio = positions[positions['date'] == positions['date'].max()]
-    portfolio = portfolio.groupby(['date', 'uniqueidtype', 'uniqueid']).sum()[['mktval', 'units']]
-    portfolio = portfolio.reset_index()
-    portfolio = portfolio.merge(securities, on=['date', 'uniqueid', 'uniqueidtype'], how='left')
-    portfolio = portfolio.merge(exposures, on='ticker', how='left')
-
-    portfolio['MV($)'] = portfolio['mktval']
-    portfolio['NetMV($)'] = portfolio['MV($)'] * np.sign(portfolio['leverage'])
-    portfolio['GrossMV($)'] = portfolio['MV($)'] * np.abs(portfolio['leverage'])
-    portfolio['BAGMV($)'] = portfolio['MV($)'] * portfolio['beta']
-    portfolio['NetGrossMV($)'] = portfolio['MV($)'] * portfolio['leverage']
-
-    portfolio = portfolio.rename(columns={'date': 'Date'})
-    portfolio_summary = portfolio.groupby('Date').sum()
-    portfolio_summary = portfolio_summary[
-        ['MV($)', 'GrossMV($)', 'BAGMV($)', 'NetMV($)', 'NetGrossMV($)']]
+    # Account ids are only unique within a tenant.
+    position_keys = _POSITION_KEYS
+    if TENANT_COL in positions.columns:
+        position_keys = [TENANT_COL] + position_keys
+    if context.acctid is not None:
+        positions = positions[positions['acctid'].isin(context.acctid)]
+    positions = positions.drop_duplicates(subset=position_keys, keep='last')
+    positions = positions[position_keys + ['mktval', 'units']]
+    return positions.merge(securities, on=['date', 'uniqueid', 'uniqueidtype'], how='left')
+
+
+@register_intermediate('latest_portfolio', intermediates=['portfolio_history'])
+def latest_portfolio(context: ViewContext) -> pd.DataFrame:
+    """Latest aggregate portfolio by security.
+
+    Across tenants, each tenant contributes the positions of its own latest date (see
+    tenant_portfolio), reported as of the latest date of all tenants.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with market value and units by security for the latest date.
+    """
+    portfolio = context.intermediate('portfolio_history')
+    if TENANT_COL in portfolio.columns:
+        latest = portfolio.groupby(TENANT_COL, observed=True)['date'].transform('max')
+        portfolio = portfolio[portfolio['date'] == latest]
+        portfolio = portfolio.assign(date=portfolio['date'].max())
+    else:
+        portfolio = portfolio[portfolio['date'] == portfolio['date'].max()]
+    portfolio = portfolio.fillna({'ticker': ''})
+    portfolio = portfolio.groupby(['date', 'uniqueidtype', 'uniqueid', 'ticker'], observed=True)[
+        ['mktval', 'units']].sum()
+    return portfolio.reset_index().replace({'ticker': {'': np.nan}})
+
+
+@register_intermediate('tenant_portfolio', intermediates=['portfolio_history'])
+def tenant_portfolio(context: ViewContext) -> pd.DataFrame:
+    """Positions of each tenant for its own latest date.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with market value and units by tenant, account and security.
+    """
+    portfolio = context.intermediate('portfolio_history')
+    latest = portfolio.groupby(TENANT_COL, observed=True)['date'].transform('max')
+    return portfolio[portfolio['date'] == latest]
+
+
+# -----------------------------------------------------------------------------
+# -- Views
+# -----------------------------------------------------------------------------
+_RISK_EXPOSURES = ['ticker', 'date', 'leverage', 'beta']
+
+
+_SUMMARY_INDEX = {'date': 'Date', TENANT_COL: 'Tenant'}
+
+
+def risk_summary(
+        portfolio: pd.DataFrame,
+        exposures: pd.DataFrame,
+        fund_holdings: pd.DataFrame,
+        group_by: Optional[List[str]] = None) -> pd.DataFrame:
+    """Compute risk statistics by date (or other portfolio columns).
+
+    Args:
+        portfolio: Positions with date, ticker, mktval and group_by columns.
+        exposures: Exposures with ticker, date, leverage and beta columns.
+        fund_holdings: Fund holdings used to look through fund positions.
+        group_by: Portfolio columns to compute statistics by. Defaults to date.
+
+    Returns:
+        pandas DataFrame with portfolio risk statistics by group.
+    """
+    group_by = group_by or ['date']
+    exposures = exposures.reset_index()
+    exposures['net'] = np.sign(exposures['leverage'])
+    exposures['gross'] = np.abs(exposures['leverage'])
+
+    portfolio_summary = exposure.compute_exposures(
+        positions=portfolio,
+        exposures=exposures,
+        group_by=group_by,
+        factors=['gross', 'beta', 'net', 'leverage'],
+        fund_holdings=fund_holdings)
+    portfolio_summary.columns = ['MV($)', 'GrossMV($)', 'BAGMV($)', 'NetMV($)', 'NetGrossMV($)']
+    portfolio_summary.index.names = [_SUMMARY_INDEX.get(col, col) for col in group_by]
+
     portfolio_summary['Gross(%)'] = 100 * (
             portfolio_summary['GrossMV($)'] / portfolio_summary['MV($)'])
     portfolio_summary['BAG(%)'] = 100 * (
@@ -54,24 +547,192 @@ def risk(acctid: Union[list, None] = None) -> pd.DataFrame:
     portfolio_summary['NetGrossMV(%)'] = 100 * (
             portfolio_summary['NetGrossMV($)'] / portfolio_summary['MV($)'])
 
-    for col in portfolio_summary.columns:
-        portfolio_summary[col] = portfolio_summary[col].round(2)
+    return portfolio_summary.round(2)
+
+
+@register_view(
+    'risk',
+    tables={'exposures': _RISK_EXPOSURES, 'fund_holdings': None},
+    intermediates=['latest_portfolio'],
+    transpose=True)
+def risk(context: ViewContext) -> pd.DataFrame:
+    """Compute risk of aggregate portfolio.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with portfolio risk statistics.
+    """
+    return risk_summary(
+        portfolio=context.intermediate('latest_portfolio'),
+        exposures=context.table('exposures'),
+        fund_holdings=context.table('fund_holdings'))
+
+
+@register_view(
+    'risk_history',
+    tables={'exposures': _RISK_EXPOSURES, 'fund_holdings': None},
+    intermediates=['portfolio_history'])
+def risk_history(context: ViewContext) -> pd.DataFrame:
+    """Compute risk of aggregate portfolio for all dates.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with portfolio risk statistics by date.
+    """
+    return risk_summary(
+        portfolio=context.intermediate('portfolio_history'),
+        exposures=context.table('exposures'),
+        fund_holdings=context.table('fund_holdings'))
+
+
+@register_view(
+    'factors',
+    tables={'exposures': None, 'fund_holdings': None},
+    intermediates=['latest_portfolio'],
+    transpose=True)
+def factors(context: ViewContext) -> pd.DataFrame:
+    """Compute exposure of aggregate portfolio to every factor in the exposures table.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with market value weighted factor exposures.
+    """
+    factor_exposures = exposure.compute_exposures(
+        positions=context.intermediate('latest_portfolio'),
+        exposures=context.table('exposures'),
+        group_by=['date'],
+        fund_holdings=context.table('fund_holdings'))
+    factor_exposures.index.name = 'Date'
+    factor_exposures = factor_exposures.rename(columns={'mktval': 'MV($)'})
+    for col in factor_exposures.columns.drop('MV($)'):
+        factor_exposures[col] = factor_exposures[col] / factor_exposures['MV($)']
+    return factor_exposures.round(2)
+
+
+@register_view(
+    'tenants',
+    tables={'exposures': _RISK_EXPOSURES, 'fund_holdings': None},
+    intermediates=['tenant_portfolio'],
+    cross_tenant=True)
+def tenants_summary(context: ViewContext) -> pd.DataFrame:
+    """Compute latest date, number of accounts and risk of each tenant's portfolio.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with portfolio risk statistics by tenant.
+    """
+    portfolio = context.intermediate('tenant_portfolio')
+    summary = risk_summary(
+        portfolio=portfolio,
+        exposures=context.table('exposures'),
+        fund_holdings=context.table('fund_holdings'),
+        group_by=[TENANT_COL])
+    by_tenant = portfolio.groupby(TENANT_COL, observed=True)
+    summary.insert(0, 'Date', by_tenant['date'].max())
+    summary.insert(1, 'Accounts', by_tenant['acctid'].nunique())
+    return summary
+
+
+@register_view('flows', tables={'flow_rollup': None})
+def flows(context: ViewContext) -> pd.DataFrame:
+    """Compute monthly cash flows, fees and dividends of aggregate portfolio.
+
+    Reads the flow rollup (see ofxdb.data.rollup), so the cost scales with the number of months
+    rather than the number of transactions.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with inflows, outflows, net flows, fees and dividends by month.
+    """
+    monthly = rollup.combine_flows(context.table('flow_rollup'), freq='M').reset_index()
+    if context.acctid is not None:
+        monthly = monthly[monthly['acctid'].isin(context.acctid)]
+    monthly = monthly.groupby('period', sort=True)[rollup.FLOW_VALUES].sum()
+    monthly.index.name = 'Month'
+    monthly = monthly.rename(columns={
+        'inflow': 'Inflow($)', 'outflow': 'Outflow($)', 'net_flow': 'NetFlow($)',
+        'fees': 'Fees($)', 'dividends': 'Dividends($)', 'count': 'Transactions'})
+    return monthly.round(2)
 
-    headers = ['Date', portfolio_summary.index[0]]
-    return portfolio_summary.T.to_markdown(
-        headers=headers, tablefmt='fancy_grid', numalign='right', floatfmt=',.2f')
+
+@register_view('balances', tables={'balance_rollup': None})
+def balances(context: ViewContext) -> pd.DataFrame:
+    """Compute month-end balances of aggregate portfolio by balance name and type.
+
+    Reads the balance rollup (see ofxdb.data.rollup): each account contributes its latest balance
+    of the month.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with balance values by month, balance name and balance type.
+    """
+    by = [TENANT_COL] if TENANT_COL in context.table('balance_rollup').columns else None
+    monthly = rollup.combine_balances(context.table('balance_rollup'), freq='M', by=by)
+    if context.acctid is not None:
+        monthly = monthly[monthly['acctid'].isin(context.acctid)]
+    monthly = monthly.groupby(['period', 'name', 'baltype'], sort=True)['value'].sum()
+    monthly = monthly.reset_index().set_index('period')
+    monthly.index.name = 'Month'
+    monthly = monthly.rename(columns={'name': 'Name', 'baltype': 'BalType', 'value': 'Value'})
+    return monthly.round(2)
+
+
+@register_view('holdings', intermediates=['latest_portfolio'])
+def holdings(context: ViewContext) -> pd.DataFrame:
+    """Compute holdings of aggregate portfolio.
+
+    Args:
+        context: View context.
+
+    Returns:
+        pandas DataFrame with market value, units and weight by security.
+    """
+    portfolio = context.intermediate('latest_portfolio')
+    portfolio = portfolio.rename(columns={
+        'date': 'Date', 'ticker': 'Ticker', 'mktval': 'MV($)', 'units': 'Units'})
+    portfolio = portfolio.set_index('Ticker')[['Date', 'Units', 'MV($)']]
+    portfolio['Weight(%)'] = 100 * portfolio['MV($)'] / portfolio['MV($)'].sum()
+    return portfolio.sort_values('MV($)', ascending=False).round(2)
 
 
 if __name__ == '__main__':
-    VIEWS = {
-        'risk': risk
-    }
     description = 'View aggregated account data.'
     arg_parser = argparse.ArgumentParser(description=description)
     arg_parser.add_argument(
-        '-view', type=str, default=VIEWS.keys(), nargs='+', help='View(s) to show.')
+        '-view', type=str, default=None, nargs='+', choices=list(VIEWS.keys()),
+        help='View(s) to show. Shows all views if not set.')
     arg_parser.add_argument(
         '-acctid', type=str, default=None, nargs='+', help='Account ID(s) to show.')
+    arg_parser.add_argument(
+        '-format', type=str, default='markdown', choices=list(OUTPUT_FORMATS.keys()),
+        help='Output format.')
+    arg_parser.add_argument(
+        '-output', type=str, default=None,
+        help='Directory to write views to (one file per view). Views are printed if not set.')
+    arg_parser.add_argument(
+        '-tenant', type=str, default=None, nargs='+',
+        help='Tenant(s) to run the views across. Uses the database directory itself if not set.')
+    arg_parser.add_argument(
+        '-workers', type=int, default=None, help='Maximum number of concurrent reads and views.')
+    arg_parser.add_argument(
+        '--mmap',
+        dest='mmap',
+        action='store_const',
+        const=True,
+        default=False,
+        help='Read memory-mapped copies of large tables.')
     arg_parser.add_argument(
         '--refresh',
         dest='refresh',
@@ -81,9 +742,31 @@ if __name__ == '__main__':
         help='Refresh data.')
     args = arg_parser.parse_args()
 
-    if args.refresh:
+    if args.format == 'parquet' and args.output is None:
+        arg_parser.error('-format parquet requires -output.')
+
+    if args.refresh and args.tenant is not None:
+        failed = {
+            tenant_name: error
+            for tenant_name, error in tenants.run_tenants(args.tenant).items() if error is not None
+        }
+        if failed:
+            # Do not show views on stale data for tenants that failed to refresh.
+            arg_parser.exit(1, ''.join(
+                f'Refresh failed for tenant ({tenant_name}): {error!r}\n'
+                for tenant_name, error in failed.items()))
+    elif args.refresh:
         extarct.extract()
         agg.agg()
 
-    for view in args.view:
-        print(VIEWS[view](args.acctid))
+    view_names = args.view or [
+        name for name, spec in VIEWS.items() if args.tenant is not None or not spec.cross_tenant
+    ]
+    results = run_views(
+        view_names, acctid=args.acctid, max_workers=args.workers, mmap=args.mmap,
+        tenant_names=args.tenant)
+    for view_name, result in results.items():
+        if args.output is None:
+            print(format_view(view_name, result, args.format))
+        else:
+            print(write_view(view_name, result, args.format, args.output))
@@ -18,13 +18,12 @@ setuptools.setup(
         "Environment :: Console",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Intended Audience :: Developers",
         "Topic :: Office/Business :: Financial :: Investment"
     ],
-    python_requires=">=3.7",
-    install_requires=["ofxtools>=0.8.20", "pandas>=1.0.1", "keyring>=21.1.0"],
+    python_requires=">=3.8",
+    install_requires=["ofxtools>=0.8.20", "pandas>=2.0", "keyring>=21.1.0"],
 )
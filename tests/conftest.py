@@ -0,0 +1,30 @@
+"""Shared test fixtures."""
+from typing import Callable, Dict, List
+
+import pytest
+
+from ofxdb.data import agg, rollup
+from ofxdb.utils import file_util, journal
+
+
+@pytest.fixture
+def write_run() -> Callable[..., str]:
+    """Commit one aggregation run of records the way agg.agg does.
+
+    The returned function takes the database directory, table name -> records and whether to
+    write the rollup deltas of the run, and returns the run id.
+    """
+    def write(db_dir: str, tables: Dict[str, List[dict]], rollups: bool = True) -> str:
+        with journal.Transaction(db_dir) as txn:
+            new_tables = {
+                table: agg.write_records(records, table, txn)
+                for table, records in tables.items() if records
+            }
+            if rollups:
+                rollup.write_rollups(new_tables, txn)
+        manifest = file_util.read_manifest(db_dir)
+        for table in file_util.MMAP_COLUMNS:
+            if file_util.table_partitions(table, db_dir=db_dir, manifest=manifest):
+                file_util.write_mmap(table, db_dir=db_dir, manifest=manifest)
+        return txn.run_id
+    return write
@@ -0,0 +1,95 @@
+"""Tests for the vectorized exposure engine (ofxdb.exposure)."""
+import numpy as np
+import pandas as pd
+
+from ofxdb import exposure
+
+
+def positions(*rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['acctid', 'date', 'ticker', 'mktval'])
+
+
+def test_date_ordinals_with_dates_datetimes_and_missing_values():
+    ordinals = exposure.date_ordinals(pd.Series(['2020-05-01', '2020-05-02 21:00:00+00:00', None]))
+
+    assert ordinals.tolist() == [18383, 18384, exposure._STATIC_DATE]
+
+
+def test_exposures_as_of_the_position_date():
+    exposures = pd.DataFrame([
+        ['AAA', None, 0.5],
+        ['AAA', '2020-03-01', 1.0],
+        ['AAA', '2020-06-01', 2.0],
+        ['BBB', '2020-01-01', 3.0],
+    ], columns=['ticker', 'date', 'beta'])
+    portfolio = positions(
+        ['A1', '2020-02-01', 'AAA', 100.0],  # before any dated row: static row
+        ['A1', '2020-02-01', 'BBB', 10.0],
+        ['A1', '2020-03-01', 'AAA', 100.0],  # effective on the row date
+        ['A1', '2020-05-31', 'AAA', 200.0],
+        ['A1', '2020-07-01', 'AAA', 100.0],
+    )
+
+    result = exposure.compute_exposures(portfolio, exposures, group_by=['date'])
+
+    assert result.to_dict('index') == {
+        '2020-02-01': {'mktval': 110.0, 'beta': 0.5 * 100 + 3.0 * 10},
+        '2020-03-01': {'mktval': 100.0, 'beta': 1.0 * 100},
+        '2020-05-31': {'mktval': 200.0, 'beta': 1.0 * 200},
+        '2020-07-01': {'mktval': 100.0, 'beta': 2.0 * 100},
+    }
+
+
+def test_positions_without_an_exposure_row_before_their_date():
+    exposures = pd.DataFrame([
+        ['BBB', '2020-01-01', 3.0],
+        ['CCC', '2020-06-01', 1.5],
+    ], columns=['ticker', 'date', 'beta'])
+    portfolio = positions(
+        ['A1', '2020-05-01', 'CCC', 100.0],  # CCC exposures start later
+        ['A1', '2020-05-01', 'DDD', 40.0],  # no exposures at all
+        ['A1', '2020-06-15', 'CCC', 100.0],
+    )
+
+    result = exposure.compute_exposures(portfolio, exposures, group_by=['date'])
+
+    assert result.to_dict('index') == {
+        '2020-05-01': {'mktval': 140.0, 'beta': 0.0},
+        '2020-06-15': {'mktval': 100.0, 'beta': 1.5 * 100},
+    }
+
+
+def test_look_through_splits_fund_positions_by_holding_weight():
+    rows, securities, values = exposure.look_through(
+        securities=np.array([2, 0, 2]),
+        values=np.array([100.0, 50.0, 10.0]),
+        funds=np.array([2, 2]),
+        holdings=np.array([0, 1]),
+        weights=np.array([0.6, 0.4]),
+        n_securities=3)
+
+    assert rows.tolist() == [0, 0, 1, 2, 2]
+    assert securities.tolist() == [0, 1, 0, 0, 1]
+    assert np.allclose(values, [60.0, 40.0, 50.0, 6.0, 4.0])
+
+
+def test_fund_positions_use_the_exposures_of_their_holdings():
+    exposures = pd.DataFrame([
+        ['AAA', 1.0],
+        ['BBB', 2.0],
+        ['FFF', 9.0],  # replaced by the holdings
+    ], columns=['ticker', 'beta'])
+    fund_holdings = pd.DataFrame([
+        ['FFF', 'AAA', 0.6],
+        ['FFF', 'BBB', 0.4],
+    ], columns=['fund', 'ticker', 'weight'])
+    portfolio = positions(
+        ['A1', '2020-05-01', 'FFF', 100.0],
+        ['A2', '2020-05-01', 'AAA', 50.0],
+    )
+
+    result = exposure.compute_exposures(
+        portfolio, exposures, group_by=['acctid'], fund_holdings=fund_holdings)
+
+    assert result['mktval'].to_dict() == {'A1': 100.0, 'A2': 50.0}
+    assert np.allclose(result['beta'], [0.6 * 100 * 1.0 + 0.4 * 100 * 2.0, 50.0 * 1.0])
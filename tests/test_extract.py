@@ -0,0 +1,18 @@
+"""Tests for running ofxget against a tenant's config (ofxdb.data.extarct)."""
+import pytest
+
+from ofxdb.data import extarct
+
+
+@pytest.mark.parametrize('platform, var', [('linux', 'XDG_CONFIG_HOME'), ('win32', 'APPDATA')])
+def test_config_env_sets_the_config_home(monkeypatch, platform, var):
+    monkeypatch.setattr(extarct.sys, 'platform', platform)
+
+    assert extarct.config_env('/tenant/config')[var] == '/tenant/config'
+
+
+def test_config_env_fails_where_the_config_home_is_ignored(monkeypatch):
+    monkeypatch.setattr(extarct.sys, 'platform', 'darwin')
+
+    with pytest.raises(ValueError):
+        extarct.config_env('/tenant/config')
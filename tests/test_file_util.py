@@ -0,0 +1,49 @@
+"""Tests for table partition and memory-mapped reads (ofxdb.utils.file_util)."""
+import threading
+
+from ofxdb.utils import file_util
+
+
+def transaction(acctid: str, fitid: str) -> dict:
+    return {'datetime': '2020-05-01 21:00:00+00:00', 'date': '2020-05-01', 'acctid': acctid,
+            'uniqueid': '123456789', 'uniqueidtype': 'CUSIP', 'fitid': fitid, 'units': 1.0,
+            'unitprice': 2.0, 'total': -2.0}
+
+
+def test_key_columns_are_read_as_strings(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'transactions': [transaction('0012345', '001')]})
+
+    table_df = file_util.read_db_table('transactions', db_dir=db_dir, columns=['acctid', 'fitid'])
+
+    assert table_df['acctid'].tolist() == ['0012345']
+    assert table_df['fitid'].tolist() == ['001']
+
+
+def test_mmap_keys_with_numeric_and_text_values(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    for acctid in ['12345', 'A777', 'A777']:
+        write_run(db_dir, {'transactions': [transaction(acctid, fitid=acctid)]})
+
+    mmap_df = file_util.read_mmap_table('transactions', db_dir=db_dir, columns=['acctid'])
+
+    assert mmap_df['acctid'].tolist() == ['12345', 'A777', 'A777']
+    csv_df = file_util.read_db_table('transactions', db_dir=db_dir, columns=['acctid', 'total'])
+    assert csv_df['acctid'].tolist() == mmap_df['acctid'].tolist()
+
+
+def test_mmap_reads_wait_for_refreshes(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'transactions': [transaction('0012345', '001')]})
+    lock_file = f'{file_util.mmap_dir("transactions", db_dir=db_dir)}/.lock'
+    results = []
+    reader = threading.Thread(target=lambda: results.append(file_util.read_mmap_table(
+        'transactions', db_dir=db_dir, columns=['acctid'])))
+
+    with file_util.locked(lock_file):
+        reader.start()
+        reader.join(timeout=0.2)
+        assert reader.is_alive()
+    reader.join()
+
+    assert results[0]['acctid'].tolist() == ['0012345']
@@ -0,0 +1,69 @@
+"""Tests for the aggregation run journal (ofxdb.utils.journal)."""
+import pandas as pd
+import pytest
+
+from ofxdb.utils import file_util, journal
+
+
+def position(day: int, **columns) -> dict:
+    return {'datetime': f'2020-05-0{day} 21:00:00+00:00', 'acctid': 'A1', 'mktval': 10.0 * day,
+            **columns}
+
+
+def test_rollback_truncates_partitions_and_new_columns(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    first = write_run(db_dir, {'positions': [position(1)]})
+    write_run(db_dir, {'positions': [position(2, newcol='x')]})
+    assert list(file_util.read_db_table('positions', db_dir=db_dir).columns) == [
+        'acctid', 'mktval', 'newcol']
+
+    manifest = journal.rollback(db_dir=db_dir)
+
+    assert [run['run_id'] for run in manifest['history']] == [first]
+    assert 'newcol' not in manifest['tables']['positions.csv']['columns']
+    assert list(file_util.read_db_table('positions', db_dir=db_dir)['mktval']) == [10.0]
+
+
+def test_compaction_is_a_rollback_barrier(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    first = write_run(db_dir, {'positions': [position(1)]})
+    write_run(db_dir, {'positions': [position(2)]})
+    journal.compact(db_dir=db_dir)
+
+    with pytest.raises(ValueError):
+        journal.rollback(db_dir=db_dir)
+    with pytest.raises(ValueError):
+        journal.rollback(run_id=first, db_dir=db_dir)
+    assert len(file_util.table_partitions('positions', db_dir=db_dir)) == 1
+    assert list(file_util.read_db_table('positions', db_dir=db_dir)['mktval']) == [10.0, 20.0]
+
+    write_run(db_dir, {'positions': [position(3)]})
+    journal.rollback(db_dir=db_dir)
+    assert list(file_util.read_db_table('positions', db_dir=db_dir)['mktval']) == [10.0, 20.0]
+
+
+def test_aborted_run_leaves_tables_untouched(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'positions': [position(1)]})
+    with pytest.raises(RuntimeError):
+        with journal.Transaction(db_dir) as txn:
+            pd.DataFrame([position(2)]).set_index('datetime').to_csv(
+                txn.stage_partition('positions', ['datetime', 'acctid', 'mktval'], 1))
+            raise RuntimeError('parse error')
+
+    assert list(file_util.read_db_table('positions', db_dir=db_dir)['mktval']) == [10.0]
+    assert len(list(tmp_path.joinpath('tables').glob('positions.*.csv'))) == 1
+
+
+def test_dropped_partitions_are_kept_until_the_next_commit(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'positions': [position(1)]})
+    write_run(db_dir, {'positions': [position(2)]})
+    previous = file_util.read_manifest(db_dir)
+    journal.compact(db_dir=db_dir)
+
+    assert list(file_util.read_db_table('positions', db_dir=db_dir, manifest=previous)[
+        'mktval']) == [10.0, 20.0]
+
+    write_run(db_dir, {'positions': [position(3)]})
+    assert len(list(tmp_path.joinpath('tables').glob('positions.*.csv'))) == 2
@@ -0,0 +1,87 @@
+"""Tests for the balance and cash-flow rollups (ofxdb.data.rollup)."""
+import datetime
+import warnings
+
+import pytest
+
+from ofxdb.data import rollup
+from ofxdb.utils import file_util
+from ofxdb import view
+
+_UTC = datetime.timezone.utc
+_RUN_DATETIME = datetime.datetime(2020, 6, 1, tzinfo=_UTC)
+
+
+def record(**columns) -> dict:
+    return {'datetime': _RUN_DATETIME, 'date': _RUN_DATETIME.date(), 'server': 'broker',
+            'user': 'user', 'acctid': '0012345', 'brokerid': 'broker.com', **columns}
+
+
+def transaction(fitid: str, day: int, trnamt: float) -> dict:
+    return record(fitid=fitid, dtposted=datetime.datetime(2020, 5, day, tzinfo=_UTC),
+                  trnamt=trnamt, trntype='CREDIT')
+
+
+def balance(value: float, dtasof=None, name: str = 'Cash') -> dict:
+    return record(name=name, desc=name, baltype='DOLLAR', value=value, dtasof=dtasof)
+
+
+def test_resent_transactions_are_counted_once(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'transactions': [transaction('F1', 1, 100.0)],
+                       'balances': [balance(100.0)]})
+    write_run(db_dir, {'transactions': [transaction('F1', 1, 100.0), transaction('F2', 2, 2.0)]})
+    write_run(db_dir, {'transactions': [transaction('F1', 1, 100.0), transaction('F2', 2, 2.0),
+                                        transaction('F3', 3, 3.0)]})
+
+    flows = rollup.combine_flows(file_util.read_db_table('flow_rollup', db_dir=db_dir))
+
+    assert flows.index.tolist() == [('2020-05', '0012345')]
+    assert flows['count'].tolist() == [3]
+    assert flows['inflow'].tolist() == [105.0]
+
+
+def test_views_filter_leading_zero_accounts(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'transactions': [transaction('F1', 1, 100.0)],
+                       'balances': [balance(100.0)]})
+
+    views = view.run_views(['flows', 'balances'], acctid=['0012345'], db_dir=db_dir)
+
+    assert views['flows']['NetFlow($)'].tolist() == [100.0]
+    assert views['balances']['Value'].tolist() == [100.0]
+
+
+def test_backfill_with_balances_missing_dtasof(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'transactions': [transaction('F1', 1, 100.0)], 'balances': [
+        balance(100.0), balance(50.0, dtasof=datetime.datetime(2020, 5, 3, tzinfo=_UTC),
+                                name='Margin')]}, rollups=False)
+    june = datetime.datetime(2020, 6, 2, tzinfo=_UTC)
+    write_run(db_dir, {'transactions': [transaction('F2', 2, 5.0)],
+                       'balances': [balance(120.0, dtasof=june)]})
+
+    balances = rollup.combine_balances(file_util.read_db_table('balance_rollup', db_dir=db_dir))
+    flows = rollup.combine_flows(file_util.read_db_table('flow_rollup', db_dir=db_dir))
+
+    assert balances[['period', 'name', 'value']].values.tolist() == [
+        ['2020-05', 'Margin', 50.0], ['2020-06', 'Cash', 120.0]]
+    assert flows['count'].tolist() == [2]
+
+
+def test_views_warn_until_rollups_are_rebuilt(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    write_run(db_dir, {'transactions': [transaction('F1', 1, 100.0)],
+                       'balances': [balance(100.0)]}, rollups=False)
+
+    with pytest.warns(UserWarning, match='rollup.py --rebuild'):
+        views = view.run_views(['flows'], db_dir=db_dir)
+    assert views['flows'].empty
+
+    rollup.rebuild_rollups(db_dir=db_dir)
+    rollup.rebuild_rollups(db_dir=db_dir)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        views = view.run_views(['flows', 'balances'], db_dir=db_dir)
+    assert views['flows']['NetFlow($)'].tolist() == [100.0]
+    assert views['balances']['Value'].tolist() == [100.0]
@@ -0,0 +1,13 @@
+"""Tests for the table schema registry (ofxdb.data.schema)."""
+from ofxtools import models
+
+from ofxdb.data import schema
+
+
+def test_bank_transactions_are_ordered_by_the_schema():
+    columns = schema.model_columns(models.STMTTRN)
+
+    ordered = schema.order_columns('transactions', sorted(columns))
+
+    assert set(columns) <= set(schema.get_schema('transactions'))
+    assert ordered == [col for col in schema.get_schema('transactions') if col in columns]
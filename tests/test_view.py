@@ -0,0 +1,34 @@
+"""Tests for views run across tenants (ofxdb.view)."""
+from ofxdb.data import tenants
+from ofxdb import view
+
+
+def position(date: str, ticker: str, mktval: float) -> dict:
+    return {'datetime': f'{date} 21:00:00+00:00', 'date': date, 'acctid': '0012345',
+            'uniqueid': ticker, 'uniqueidtype': 'TICKER', 'heldinacct': 'CASH', 'postype': 'LONG',
+            'units': mktval / 100, 'mktval': mktval}
+
+
+def security(date: str, ticker: str) -> dict:
+    return {'datetime': f'{date} 21:00:00+00:00', 'date': date, 'uniqueid': ticker,
+            'uniqueidtype': 'TICKER', 'ticker': ticker}
+
+
+def test_latest_portfolio_uses_latest_date_of_each_tenant(tmp_path, write_run):
+    db_dir = str(tmp_path)
+    cfg_file = tmp_path / 'ofxget.cfg'
+    cfg_file.write_text('[DEFAULT]\n')
+    for tenant, date, ticker, mktval in [('alice', '2020-05-01', 'AGG', 200.0),
+                                         ('bob', '2020-05-02', 'HYG', 500.0)]:
+        tenant_db_dir = tenants.add_tenant(tenant, str(cfg_file), db_dir=db_dir)
+        write_run(tenant_db_dir, {'positions': [position(date, ticker, mktval)],
+                                  'securities': [security(date, ticker)]})
+
+    views = view.run_views(
+        ['holdings', 'risk', 'tenants'], db_dir=db_dir, tenant_names=['alice', 'bob'])
+
+    holdings = views['holdings']
+    assert holdings['MV($)'].to_dict() == {'HYG': 500.0, 'AGG': 200.0}
+    assert holdings['Date'].unique().tolist() == ['2020-05-02']
+    assert views['risk']['MV($)'].tolist() == [700.0]
+    assert views['tenants']['Date'].to_dict() == {'alice': '2020-05-01', 'bob': '2020-05-02'}